@@ -1,73 +1,328 @@
-import os
-import openai
 import discord
 import time
 import asyncio
-from datetime import datetime, timedelta
+import logging
+from abc import ABC, abstractmethod
+
+from metrics import REGISTRY, TOKEN_BUCKETS, current_span, span, trace_id
+from providers import OpenAIProvider, ProviderRouter
+from ratelimit import BACKGROUND_RETRY_DELAY, LLM_BACKGROUND_HEADROOM, LLM_WORKERS, NoHeadroomError
+from response_cache import ResponseCache
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, FairScheduler, LLMRequest
 
-GPT_MODEL = "gpt-4o-2024-11-20"
 SYSTEM_PROMPT = "You are a helpful assistant."
 
-class GPTAgent:
+logger = logging.getLogger("discord")
+
+class UsageStats:
+    """Running totals of provider-reported usage, including automatic prompt-cache hits"""
+
     def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = openai.AsyncOpenAI(api_key=self.api_key)
-        # Add rate limiting
-        self.request_queue = asyncio.Queue()
-        self.last_request_time = datetime.now()
-        self.min_request_interval = 1.0  # Minimum seconds between requests
-        self.is_processing = False
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cached_calls = 0  # Calls where any prompt tokens were served from cache
+        self.cached_latency = 0.0
+        self.uncached_latency = 0.0
 
-    async def process_queue(self):
-        """Process queued requests with rate limiting"""
-        if self.is_processing:
-            return
+    def record(self, usage, latency: float) -> int:
+        """Add one completion's usage; returns its cached prompt tokens"""
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.cached_tokens += cached
+        if cached:
+            self.cached_calls += 1
+            self.cached_latency += latency
+        else:
+            self.uncached_latency += latency
+        return cached
 
-        self.is_processing = True
-        try:
-            while not self.request_queue.empty():
-                time_since_last = (datetime.now() - self.last_request_time).total_seconds()
-                if time_since_last < self.min_request_interval:
-                    await asyncio.sleep(self.min_request_interval - time_since_last)
-
-                request = await self.request_queue.get()
-                messages, future = request
-
-                try:
-                    response = await self.client.chat.completions.create(
-                        model=GPT_MODEL,
-                        messages=messages,
-                    )
-                    future.set_result(response.choices[0].message.content)
-                except Exception as e:
-                    future.set_exception(e)
+    def snapshot(self) -> dict:
+        uncached_calls = self.calls - self.cached_calls
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hit_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "avg_latency_cached": self.cached_latency / self.cached_calls if self.cached_calls else 0.0,
+            "avg_latency_uncached": self.uncached_latency / uncached_calls if uncached_calls else 0.0,
+        }
 
-                self.last_request_time = datetime.now()
-                self.request_queue.task_done()
-        finally:
-            self.is_processing = False
+def custom_messages(system_prompt: str, user_prompt: str) -> list:
+    """Chat messages for a system + user prompt pair, as generate_custom_response sends them"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    async def queue_request(self, messages):
-        """Queue a request and return a future for the result"""
-        future = asyncio.Future()
-        await self.request_queue.put((messages, future))
+class BaseAgent(ABC):
+    """
+    Response cache and prompt helpers shared by every agent. Subclasses decide where
+    requests run by implementing queue_request, queue_stream_request, cancel_pending
+    and has_headroom.
+    """
 
-        asyncio.create_task(self.process_queue())
+    def __init__(self, cache_namespace: str):
+        self.response_cache = ResponseCache()
+        # Cache keys cover every model that may have produced the answer
+        self.cache_namespace = cache_namespace
+        REGISTRY.callback("response_cache_hits_total", "Completions served from the response cache",
+                          lambda: self.response_cache.hits, "counter")
+        REGISTRY.callback("response_cache_misses_total", "Completions not in the response cache",
+                          lambda: self.response_cache.misses, "counter")
+        REGISTRY.callback("response_cache_bytes", "Size of the response cache", lambda: self.response_cache.size)
 
-        return await future
+    @abstractmethod
+    def cancel_pending(self, user_id, generation) -> int:
+        """Withdraw the user's requests of a superseded generation that have not started; returns how many"""
+
+    @abstractmethod
+    async def queue_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """The completion for messages, as one string"""
+
+    @abstractmethod
+    def queue_stream_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Async iterator over the completion's text deltas"""
+
+    @abstractmethod
+    async def has_headroom(self) -> bool:
+        """Whether the rate-limit budget has room for optional work such as speculation"""
+
+    async def cached_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """queue_request behind the response cache; identical in-flight calls are shared"""
+        key = ResponseCache.make_key(self.cache_namespace, messages)
+        text = await self.response_cache.shared_result(key)
+        if text is not None:
+            return text
+
+        self.response_cache.begin(key)
+        try:
+            text = await self.queue_request(messages, user_id, priority)
+        except BaseException as e:
+            self.response_cache.fail(key, e)
+            raise
+        self.response_cache.complete(key, text, user_id)
+        return text
+
+    async def cached_stream_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """queue_stream_request behind the response cache; a cached reply arrives as one delta"""
+        key = ResponseCache.make_key(self.cache_namespace, messages)
+        text = await self.response_cache.shared_result(key)
+        if text is not None:
+            yield text
+            return
+
+        self.response_cache.begin(key)
+        parts = []
+        try:
+            async for delta in self.queue_stream_request(messages, user_id, priority):
+                parts.append(delta)
+                yield delta
+        except BaseException as e:
+            self.response_cache.fail(key, e)
+            raise
+        self.response_cache.complete(key, "".join(parts), user_id)
 
     async def run(self, message: discord.Message):
-        """Default method: sends user message to GPT-4o and returns the response."""
+        """Default method: sends user message to the LLM and returns the response."""
         messages = [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": message.content},
         ]
         return await self.queue_request(messages)
 
-    async def generate_custom_response(self, system_prompt: str, user_prompt: str) -> str:
-        """Helper method to generate a custom GPT-4o response"""
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        return await self.queue_request(messages)
+    async def generate_custom_response(self, system_prompt: str, user_prompt: str, user_id=None,
+                                       priority: int = PRIORITY_INTERACTIVE) -> str:
+        """
+        Helper method to generate a custom LLM response. Identical prompts are
+        served from the response cache. user_id tags the cache entries and the queued
+        request so both can be dropped when the user's state moves on; priority picks
+        the scheduling class.
+        """
+        messages = custom_messages(system_prompt, user_prompt)
+        return await self.cached_request(messages, user_id, priority)
+
+    def uncache_custom_response(self, system_prompt: str, user_prompt: str):
+        """Forget the cached reply to these prompts, so asking again makes a fresh call"""
+        key = ResponseCache.make_key(self.cache_namespace, custom_messages(system_prompt, user_prompt))
+        self.response_cache.discard(key)
+
+    def generate_custom_response_stream(self, system_prompt: str, user_prompt: str, user_id=None,
+                                        priority: int = PRIORITY_INTERACTIVE):
+        """Streaming variant of generate_custom_response: an async iterator of text deltas"""
+        messages = custom_messages(system_prompt, user_prompt)
+        return self.cached_stream_request(messages, user_id, priority)
+
+
+class LLMAgent(BaseAgent):
+    """
+    Queue, worker pool and response cache in front of one or more providers. Requests
+    are routed (and hedged) across the providers by a ProviderRouter.
+    """
+
+    def __init__(self, providers: list, num_workers: int = LLM_WORKERS):
+        super().__init__(",".join(p.model for p in providers))
+        self.usage_stats = UsageStats()
+        self.router = ProviderRouter(providers)
+        self.request_queue = FairScheduler()
+        self.num_workers = num_workers
+        self.workers = []
+        self.prompt_tokens = REGISTRY.histogram("llm_prompt_tokens", "Prompt tokens per call", TOKEN_BUCKETS)
+        self.completion_tokens = REGISTRY.histogram("llm_completion_tokens", "Completion tokens per call", TOKEN_BUCKETS)
+        REGISTRY.callback("llm_cached_prompt_tokens_total", "Prompt tokens served from the provider's prompt cache",
+                          lambda: self.usage_stats.cached_tokens, "counter")
+
+    def start_workers(self):
+        """Spawn the worker pool on first use (and replace any worker that died)"""
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.num_workers:
+            self.workers.append(asyncio.create_task(self.process_queue()))
+
+    async def process_queue(self):
+        """Worker loop: take queued requests and dispatch them within the rate budgets"""
+        while True:
+            request = await self.request_queue.get()
+            future, deltas = request.future, request.deltas
+            if future.done():
+                continue
+
+            # Continue the trace of the interaction that queued the request
+            token = current_span.set(request.span)
+            requeued = False
+            try:
+                with span("llm_call", user=request.user_id, priority=request.priority):
+                    await self.dispatch(request)
+            except NoHeadroomError:
+                # Background work waits for spare budget back in the queue, not in a worker
+                asyncio.get_running_loop().call_later(BACKGROUND_RETRY_DELAY, self.requeue, request)
+                requeued = True
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                current_span.reset(token)
+                if deltas is not None and not requeued:
+                    deltas.put_nowait(None)
+
+    def requeue(self, request: LLMRequest):
+        if not request.future.done():
+            self.request_queue.put(request)
+            self.start_workers()
+
+    async def has_headroom(self) -> bool:
+        return any(p.breaker.available() and p.rate_limiter.headroom() >= LLM_BACKGROUND_HEADROOM
+                   for p in self.router.providers)
+
+    async def dispatch(self, request: LLMRequest):
+        """Run one request on the provider the router picks and resolve its future"""
+        future, deltas = request.future, request.deltas
+        started = time.monotonic()
+        # Background requests only use budget to spare, so they never hold up interactive ones
+        headroom = LLM_BACKGROUND_HEADROOM if request.priority == PRIORITY_BACKGROUND else 0.0
+        attempt = await self.router.open(request.messages, future, headroom)
+        if attempt is None:
+            return
+
+        provider = attempt.provider
+        parts = []
+        usage = None
+        try:
+            async for text, event_usage in attempt.events():
+                if event_usage:
+                    usage = event_usage
+                if text:
+                    parts.append(text)
+                    if deltas is not None:
+                        deltas.put_nowait(text)
+                if future.done():
+                    # The consumer stopped listening; stop paying for tokens
+                    break
+        except Exception:
+            # Too late to retry: part of the reply may already be on screen
+            provider.breaker.record_failure()
+            raise
+        finally:
+            await attempt.close()
+
+        latency = time.monotonic() - started
+        provider.calls += 1
+        provider.total_latency.observe(latency)
+        if usage:
+            provider.rate_limiter.settle(attempt.reservation, usage.total_tokens)
+            cached = self.usage_stats.record(usage, latency)
+            self.prompt_tokens.observe(usage.prompt_tokens)
+            self.completion_tokens.observe(usage.completion_tokens)
+            logger.info(
+                f"[trace {trace_id()}] LLM call ({provider.name}): {usage.prompt_tokens} prompt tokens ({cached} cached), "
+                f"{usage.completion_tokens} completion, first token {attempt.first_token:.2f}s, total {latency:.2f}s"
+            )
+        if not future.done():
+            future.set_result("".join(parts))
+
+    def cancel_pending(self, user_id, generation) -> int:
+        """Withdraw a user's queued requests of a superseded generation before they use a rate-limit slot"""
+        removed = self.request_queue.remove_generation(user_id, generation)
+        for request in removed:
+            request.future.cancel()
+            if request.deltas is not None:
+                request.deltas.put_nowait(None)
+        return len(removed)
+
+    async def queue_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Queue a request and return a future for the result"""
+        future = asyncio.get_running_loop().create_future()
+        self.request_queue.put(LLMRequest(messages, future, user_id=user_id, priority=priority))
+
+        self.start_workers()
+
+        return await future
+
+    async def queue_stream_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Queue a streaming request and yield content deltas as they arrive"""
+        future = asyncio.get_running_loop().create_future()
+        deltas = asyncio.Queue()
+        self.request_queue.put(LLMRequest(messages, future, deltas, user_id, priority))
+
+        self.start_workers()
+
+        try:
+            while (delta := await deltas.get()) is not None:
+                yield delta
+            await future  # Surfaces provider errors (or cancellation by cancel_pending)
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> dict:
+        """Usage, provider health, hedging and queueing, as plain data for !stats"""
+        router = self.router
+        return {
+            "usage": self.usage_stats.snapshot(),
+            "providers": [
+                {
+                    "name": provider.name,
+                    "calls": provider.calls,
+                    "failures": provider.failures,
+                    "first_token_p50": provider.first_token_latency.percentile(0.5),
+                    "first_token_p95": provider.first_token_latency.percentile(0.95),
+                    "circuit_open": provider.breaker.opened_at is not None,
+                }
+                for provider in router.providers
+            ],
+            "hedges": router.hedges,
+            "hedge_wins": router.hedge_wins,
+            "retries": router.retries,
+            "queues": self.request_queue.stats(),
+        }
+
+
+class GPTAgent(LLMAgent):
+    """LLMAgent backed by OpenAI alone"""
+
+    def __init__(self, num_workers: int = LLM_WORKERS, **limits):
+        super().__init__([OpenAIProvider(**limits)], num_workers)
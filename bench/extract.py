@@ -0,0 +1,72 @@
+"""
+Parse time and output size of the job-page extractors on the saved pages in bench/pages.
+
+Compares the html.parser paragraph scrape (the fallback without lxml) with the
+structured lxml extractor. Output size is what ends up in every prompt about the
+offer, in characters and tokens.
+
+    python -m bench.extract --repeat 20
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+
+from extract import extract_job_posting, format_job_posting
+from scraper import extract_paragraphs
+from tokens import count_tokens
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+
+EXTRACTORS = {
+    "paragraphs": extract_paragraphs,
+    "structured": lambda html: format_job_posting(extract_job_posting(html)),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def measure(extractor, html: str, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = extractor(html)
+        timings.append(time.perf_counter() - started)
+    return {"parse_ms": statistics.median(timings) * 1000, "chars": len(text), "tokens": count_tokens(text)}
+
+
+def main(args) -> dict:
+    report = {}
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(PAGES_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+        report[name] = {"html_bytes": len(html.encode()),
+                        **{extractor: measure(fn, html, args.repeat) for extractor, fn in EXTRACTORS.items()}}
+    return report
+
+
+def print_report(report: dict):
+    print(f"{'page':<26}{'html':>9}  {'extractor':<12}{'parse':>10}{'chars':>8}{'tokens':>8}")
+    for page, row in report.items():
+        for i, extractor in enumerate(EXTRACTORS):
+            result = row[extractor]
+            label = (page, f"{row['html_bytes'] / 1024:.0f} KiB") if i == 0 else ("", "")
+            print(f"{label[0]:<26}{label[1]:>9}  {extractor:<12}{result['parse_ms']:>8.2f}ms"
+                  f"{result['chars']:>8}{result['tokens']:>8}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = main(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+
+from aiohttp import web
+
+BOILERPLATE = "".join(
+    f"<li><a href='/nav/{i}'>Navigation link {i}</a></li>" for i in range(60)
+)
+PARAGRAPHS = [
+    "You will design, build and operate services used by millions of customers every day.",
+    "We value ownership, clear writing and pragmatic engineering over process.",
+    "Requirements: several years of backend experience, solid fundamentals, curiosity.",
+    "Benefits include health coverage, a learning budget, parental leave and equity.",
+    "Our teams are distributed across time zones and collaborate asynchronously.",
+]
+
+
+def job_page(job_id: int, paragraphs: int = 30) -> str:
+    body = "".join(f"<p>{PARAGRAPHS[(job_id + i) % len(PARAGRAPHS)]}</p>" for i in range(paragraphs))
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>Software Engineer {job_id}</title>"
+        "<script>window.analytics = {track: function () {}};</script>"
+        "<style>body { font-family: sans-serif; }</style>"
+        "</head><body>"
+        f"<nav><ul>{BOILERPLATE}</ul></nav>"
+        f"<main><h1>Software Engineer {job_id}</h1>{body}</main>"
+        "<footer><p>Copyright Example Corp. All rights reserved.</p></footer>"
+        "</body></html>"
+    )
+
+
+class FixtureServer:
+    """Serves synthetic job pages at /job/<id>, with ETags and configurable latency"""
+
+    def __init__(self, latency: float = 0.05, paragraphs: int = 30):
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.requests = 0
+        self.not_modified = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/job/{job_id}", self.job)
+        return app
+
+    async def job(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        html = job_page(int(request.match_info["job_id"]), self.paragraphs)
+        etag = '"' + hashlib.sha1(html.encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=html, content_type="text/html", headers={"ETag": etag})
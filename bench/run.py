@@ -0,0 +1,289 @@
+"""
+Offline load test for bot.py.
+
+Starts a stub OpenAI-compatible server and an HTML fixture server on localhost,
+points the bot at them, and drives many synthetic users concurrently through the
+offer modals, plain messages, !go and !advise. Reports throughput, end-to-end
+latency percentiles per operation and memory per user. Bot settings such as
+LLM_WORKERS or LLM_MAX_IN_FLIGHT come from the environment as usual.
+
+    python -m bench.run --users 100 --llm-latency 0.3 --error-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import logging
+
+from aiohttp import web
+
+from bench.fixtures import FixtureServer
+from bench.stub_llm import StubLLM
+from bench.stub_discord import StubChannel, StubContext, StubInteraction, StubMessage, StubUser
+
+OPERATIONS = ("create", "update", "message", "go", "advise")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--offers", type=int, default=3, help="Offers created per user")
+    parser.add_argument("--messages", type=int, default=3, help="Plain messages per user")
+    parser.add_argument("--rounds", type=int, default=1, help="!go rounds per user")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between a user's actions")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which users start")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub time to first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Stub delay per streamed token")
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LLM calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--fetch-latency", type=float, default=0.05)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    parser.add_argument("--round-mode", choices=("sequential", "simultaneous", "batched"), default="simultaneous")
+    parser.add_argument("--worker-processes", type=int, default=0,
+                        help="Run LLM calls and fetches in this many worker processes (LLM_WORKER_PROCESSES)")
+    parser.add_argument("--no-stream", action="store_true", help="Post replies whole instead of streaming them")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+async def start_server(app: web.Application):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def percentile(samples: list, p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def merge(snapshots: list) -> dict:
+    """Combine per-process stats: counters add up, latencies take the worst process, rates are recomputed"""
+    if len(snapshots) == 1:
+        return snapshots[0]
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if key.startswith("avg_") or key.endswith(("_p50", "_p95")):
+                merged[key] = max(merged.get(key) or 0.0, value or 0.0)
+            elif isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+    if "hits" in merged:
+        lookups = merged["hits"] + merged["misses"]
+        merged["hit_rate"] = merged["hits"] / lookups if lookups else 0.0
+    if "prompt_tokens" in merged:
+        merged["cache_hit_rate"] = merged["cached_tokens"] / merged["prompt_tokens"] if merged["prompt_tokens"] else 0.0
+    return merged
+
+
+class LoadTest:
+    def __init__(self, args, bot, fixture_url: str):
+        self.args = args
+        self.bot = bot
+        self.fixture_url = fixture_url
+        self.random = random.Random(args.seed)
+        self.latencies = {op: [] for op in OPERATIONS}
+        self.errors = {op: 0 for op in OPERATIONS}
+        self.channels = []
+
+    async def timed(self, op: str, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[op] += 1
+            logging.getLogger("bench").warning(f"{op} failed: {e!r}")
+        self.latencies[op].append(time.perf_counter() - started)
+
+    async def think(self):
+        await asyncio.sleep(self.random.expovariate(1 / self.args.think_time) if self.args.think_time else 0)
+
+    async def command(self, user: StubUser, channel: StubChannel, name: str, callback, *args):
+        """Run a prefix command the way the bot would: before hook, callback, after hook"""
+        ctx = StubContext(user, channel, name)
+        await self.bot.before_command(ctx)
+        try:
+            await callback(ctx, *args)
+        finally:
+            await self.bot.after_command(ctx)
+
+    async def create_offer(self, user: StubUser, channel: StubChannel, n: int):
+        modal = self.bot.CreateOfferModal()
+        modal.company_name._value = f"Company {user.id}-{n}"
+        modal.job_title._value = "Software Engineer"
+        modal.location._value = "Remote"
+        # Every other offer comes from a URL, exercising the fetcher and page cache
+        if n % 2:
+            modal.job_description._value = f"{self.fixture_url}/job/{self.random.randrange(50)}"
+        else:
+            modal.job_description._value = "Build reliable services. " * 20
+        modal.package._value = f"{100 + n * 10}k USD + benefits"
+        await modal.on_submit(StubInteraction(user, channel))
+
+    async def update_offer(self, user: StubUser, channel: StubChannel):
+        modal = self.bot.UpdateOfferModal("1", user.id)
+        modal.package._value = "150k USD + equity"
+        await modal.on_submit(StubInteraction(user, channel))
+
+    async def run_user(self, user_id: int):
+        await asyncio.sleep(self.random.uniform(0, self.args.ramp))
+        user = StubUser(user_id)
+        channel = StubChannel(user_id, self.args.discord_latency)
+        self.channels.append(channel)
+        for n in range(self.args.offers):
+            await self.timed("create", self.create_offer(user, channel, n))
+            await self.think()
+        await self.timed("update", self.update_offer(user, channel))
+        for n in range(self.args.messages):
+            await self.think()
+            message = StubMessage(channel, user, f"Message {n}: how flexible is the schedule and the pay?")
+            await self.timed("message", self.bot.on_message(message))
+        for _ in range(self.args.rounds):
+            await self.think()
+            await self.timed("go", self.command(user, channel, "go", self.bot.continue_debate))
+        await self.think()
+        await self.timed("advise", self.command(user, channel, "advise", self.bot.advise))
+
+    async def run(self) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(10_000 + i) for i in range(self.args.users)))
+        return time.perf_counter() - started
+
+
+async def main(args) -> dict:
+    llm = StubLLM(args.llm_latency, args.token_latency, args.completion_tokens, args.error_rate,
+                  args.retry_after, seed=args.seed)
+    fixtures = FixtureServer(args.fetch_latency)
+    llm_runner, llm_url = await start_server(llm.app())
+    fixture_runner, fixture_url = await start_server(fixtures.app())
+    data_dir = tempfile.mkdtemp(prefix="bench-")
+
+    # The bot reads its configuration at import time
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        "LLM_PROVIDERS": "openai",
+        "BOT_DB_PATH": os.path.join(data_dir, "bench.db"),
+        "METRICS_PORT": "0",
+        "ROUND_MODE": args.round_mode,
+        "STREAM_REPLIES": "false" if args.no_stream else "true",
+        "LLM_WORKER_PROCESSES": str(args.worker_processes),
+    })
+    rss_before = rss_bytes()
+    import bot
+    bot.logger.setLevel(logging.WARNING)
+
+    test = LoadTest(args, bot, fixture_url)
+    if bot.worker_pool is not None:
+        await bot.worker_pool.start()
+    try:
+        elapsed = await test.run()
+        user_ids = list(bot.user_state.last_active)
+        state_bytes = sum(bot.user_state.user_bytes(user_id) for user_id in user_ids)
+        rss_growth = rss_bytes() - rss_before
+        if bot.worker_pool is not None:
+            workers = await bot.worker_pool.stats()
+        else:
+            workers = [{"llm": bot.agent.stats(), "pages": bot.page_fetcher.stats()}]
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k != "json"},
+            "elapsed_seconds": elapsed,
+            "operations": sum(len(v) for v in test.latencies.values()),
+            "throughput_ops_per_second": sum(len(v) for v in test.latencies.values()) / elapsed,
+            "latency": {
+                op: {
+                    "count": len(samples),
+                    "errors": test.errors[op],
+                    "p50": percentile(samples, 0.50),
+                    "p95": percentile(samples, 0.95),
+                    "p99": percentile(samples, 0.99),
+                }
+                for op, samples in test.latencies.items()
+            },
+            "llm": {
+                "requests": llm.requests,
+                "rejected_429": llm.rejected,
+                "max_concurrent": llm.max_in_flight,
+                "retries": sum(w["llm"]["retries"] for w in workers),
+                **merge([w["llm"]["usage"] for w in workers]),
+            },
+            "speculation": bot.speculator.stats(),
+            "discord": {"sends": sum(c.sent for c in test.channels), "edits": sum(c.edits for c in test.channels)},
+            "queue": workers[0]["llm"]["queues"] if len(workers) == 1 else
+                     {f"worker{i} {name}": q for i, w in enumerate(workers) for name, q in w["llm"]["queues"].items()},
+            "fetches": {"requests": fixtures.requests, "not_modified": fixtures.not_modified,
+                        **merge([w["pages"] for w in workers])},
+            "memory": {
+                "resident_users": len(user_ids),
+                "state_bytes_per_user": state_bytes / max(1, len(user_ids)),
+                "rss_growth_bytes_per_user": rss_growth / max(1, args.users),
+            },
+        }
+    finally:
+        if bot.worker_pool is not None:
+            await bot.worker_pool.close()
+        else:
+            for task in bot.agent.workers:
+                task.cancel()
+        await bot.page_fetcher.close()
+        await bot.store.close()
+        await llm_runner.cleanup()
+        await fixture_runner.cleanup()
+    return report
+
+
+def print_report(report: dict):
+    config = report["config"]
+    print(f"{config['users']} users, {config['offers']} offers, {config['messages']} messages, "
+          f"{config['rounds']} rounds each; round mode {config['round_mode']}; "
+          f"LLM first token {config['llm_latency']}s, 429 rate {config['error_rate']:.0%}")
+    print(f"{report['operations']} operations in {report['elapsed_seconds']:.1f}s "
+          f"({report['throughput_ops_per_second']:.1f} ops/s)\n")
+    print(f"{'operation':<10}{'count':>7}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for op, row in report["latency"].items():
+        print(f"{op:<10}{row['count']:>7}{row['errors']:>8}{row['p50']:>8.2f}s{row['p95']:>8.2f}s{row['p99']:>8.2f}s")
+    llm = report["llm"]
+    print(f"\nLLM: {llm['calls']} calls, {llm['requests']} HTTP requests ({llm['rejected_429']} rejected with 429, "
+          f"{llm['retries']} retries), max {llm['max_concurrent']} concurrent")
+    discord = report["discord"]
+    print(f"Discord: {discord['sends']} messages sent, {discord['edits']} edits")
+    speculation = report["speculation"]
+    if speculation["calls"]:
+        print(f"Speculation: {speculation['calls']} calls, {speculation['hit_rate']:.0%} hit rate, "
+              f"{speculation['used_tokens']} tokens used, {speculation['wasted_tokens']} wasted")
+    for name, queue in report["queue"].items():
+        print(f"Queue {name}: wait p50 {queue['wait_p50']:.2f}s, p99 {queue['wait_p99']:.2f}s")
+    fetches = report["fetches"]
+    print(f"Pages: {fetches['requests']} fetched ({fetches['not_modified']} not modified), "
+          f"{fetches['hit_rate']:.0%} cache hit rate")
+    memory = report["memory"]
+    print(f"Memory: {memory['state_bytes_per_user'] / 1024:.1f} KiB state per user, "
+          f"{memory['rss_growth_bytes_per_user'] / 1024:.1f} KiB RSS growth per user")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,115 @@
+"""
+Startup cost of bot.py in the single-process and split (worker process) modes,
+for both startup profiles: "lean" (minimal intents and caches, heavy imports
+deferred to first use) and "eager" (Intents.all() and everything imported up
+front, as before; STARTUP_PROFILE=eager).
+
+Each run starts a fresh interpreter that imports the bot and, in split mode,
+waits until every worker process has connected. It reports the time from process
+start and the resident memory of the bot process and of each worker. Discord is
+not contacted, so the gateway handshake itself is not included.
+
+    python -m bench.startup --worker-processes 2 --repeat 5
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+
+PROFILES = ("lean", "eager")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-processes", type=int, default=2, help="Workers for the split mode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def rss_of(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def measure() -> dict:
+    """Runs in the child interpreter"""
+    import time
+    import logging
+
+    import bot
+    from metrics import PROCESS_STARTED, resident_bytes
+
+    bot.logger.setLevel(logging.WARNING)
+    imported = time.time() - PROCESS_STARTED
+    sample = {"import_seconds": imported, "ready_seconds": imported, "bot_rss": resident_bytes(), "worker_rss": []}
+    pool = bot.worker_pool
+    if pool is not None:
+        await pool.start()
+        while len(pool.connections) < pool.processes:
+            await asyncio.sleep(0.01)
+        sample["ready_seconds"] = time.time() - PROCESS_STARTED
+        sample["worker_rss"] = [rss_of(pid) for pid in pool.pids.values()]
+        await pool.close()
+    await bot.store.close()
+    sample["modules"] = sorted(name for name in ("openai", "bs4", "requests", "tiktoken", "validators", "mistralai")
+                               if name in sys.modules)
+    return sample
+
+
+def run_child(profile: str, processes: int, data_dir: str) -> dict:
+    env = {
+        **os.environ,
+        "STARTUP_PROFILE": profile,
+        "LLM_WORKER_PROCESSES": str(processes),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "startup-bench"),
+        "BOT_DB_PATH": os.path.join(data_dir, f"startup-{profile}-{processes}.db"),
+        "METRICS_PORT": "0",
+    }
+    output = subprocess.run([sys.executable, "-m", "bench.startup", "--child"], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples: list) -> dict:
+    return {
+        "import_seconds": statistics.median(s["import_seconds"] for s in samples),
+        "ready_seconds": statistics.median(s["ready_seconds"] for s in samples),
+        "bot_rss_bytes": statistics.median(s["bot_rss"] for s in samples),
+        "worker_rss_bytes": statistics.median(sum(s["worker_rss"]) for s in samples),
+        "heavy_modules_loaded": samples[-1]["modules"],
+    }
+
+
+def main(args) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="startup-")
+    modes = {"single": 0, "split": args.worker_processes}
+    return {f"{profile} {name}": summarize([run_child(profile, processes, data_dir) for _ in range(args.repeat)])
+            for profile in PROFILES for name, processes in modes.items()}
+
+
+def print_report(report: dict, args):
+    print(f"Median of {args.repeat} runs; split mode uses {args.worker_processes} worker processes\n")
+    print(f"{'profile, mode':<14}{'import':>9}{'ready':>9}{'bot RSS':>11}{'workers RSS':>13}  heavy modules loaded")
+    for name, row in report.items():
+        print(f"{name:<14}{row['import_seconds']:>8.2f}s{row['ready_seconds']:>8.2f}s"
+              f"{row['bot_rss_bytes'] / 2**20:>7.1f} MiB{row['worker_rss_bytes'] / 2**20:>9.1f} MiB  "
+              f"{', '.join(row['heavy_modules_loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(measure())))
+    else:
+        report = main(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report, args)
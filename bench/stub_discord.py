@@ -0,0 +1,88 @@
+import asyncio
+import itertools
+
+# Simulated Discord API round trip for every send and edit
+DISCORD_LATENCY = 0.05
+
+message_ids = itertools.count(1)
+
+
+class StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.bot = False
+        self.display_name = f"user{user_id}"
+
+    def __str__(self):
+        return self.display_name
+
+
+class StubChannel:
+    def __init__(self, channel_id: int, latency: float = DISCORD_LATENCY):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content: str = None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return StubMessage(self, None, content)
+
+
+class StubMessage:
+    def __init__(self, channel: StubChannel, author: StubUser, content: str):
+        self.id = next(message_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+    async def reply(self, content: str = None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def edit(self, content: str = None, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.edits += 1
+        self.content = content
+        return self
+
+
+class StubCommand:
+    def __init__(self, name: str):
+        self.name = name
+        self.qualified_name = name
+
+
+class StubContext:
+    """Enough of commands.Context for the bot's command callbacks and hooks"""
+
+    def __init__(self, author: StubUser, channel: StubChannel, command: str):
+        self.author = author
+        self.channel = channel
+        self.command = StubCommand(command)
+
+    async def send(self, content: str = None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class StubResponse:
+    def __init__(self, channel: StubChannel):
+        self.channel = channel
+        self.done = False
+
+    async def send_message(self, content: str = None, **kwargs):
+        self.done = True
+        await self.channel.send(content, **kwargs)
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+
+class StubInteraction:
+    """Enough of discord.Interaction for the offer modals' on_submit"""
+
+    def __init__(self, user: StubUser, channel: StubChannel):
+        self.user = user
+        self.channel = channel
+        self.response = StubResponse(channel)
+        self.followup = channel
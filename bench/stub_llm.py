@@ -0,0 +1,124 @@
+import json
+import time
+import random
+import asyncio
+import re
+
+from aiohttp import web
+
+WORDS = ("our offer gives you growth, mentorship, flexible hours and a team that ships "
+         "meaningful work while paying well above the market for your skills").split()
+
+
+class StubLLM:
+    """
+    OpenAI-compatible /v1/chat/completions with configurable latency and 429 injection.
+    Streams word-sized chunks like the real API, reports usage when asked to, sends
+    x-ratelimit-* headers, and answers batched-round prompts with JSON keyed by offer ID.
+    """
+
+    def __init__(self, first_token: float = 0.3, per_token: float = 0.01, completion_tokens: int = 120,
+                 error_rate: float = 0.0, retry_after: float = 1.0, requests_per_minute: int = 10000,
+                 tokens_per_minute: int = 10_000_000, seed: int = 0):
+        self.first_token = first_token
+        self.per_token = per_token
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.completions)
+        return app
+
+    def rate_headers(self) -> dict:
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute - 1),
+            "x-ratelimit-remaining-tokens": str(self.tokens_per_minute - 1000),
+            "x-ratelimit-reset-requests": "6ms",
+            "x-ratelimit-reset-tokens": "6ms",
+        }
+
+    def reply_text(self, messages: list) -> str:
+        prompt = messages[-1]["content"]
+        if "JSON object" in prompt:
+            offer_ids = re.findall(r"\(offer ID: (\w+)\)", prompt)
+            share = max(1, self.completion_tokens // max(1, len(offer_ids)))
+            return json.dumps({oid: " ".join(self.words(share)) for oid in offer_ids})
+        return " ".join(self.words(self.completion_tokens))
+
+    def words(self, n: int) -> list:
+        return [self.random.choice(WORDS) for _ in range(n)]
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        if self.random.random() < self.error_rate:
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error", "code": "rate_limit"}},
+                status=429,
+                headers={"retry-after": str(self.retry_after), **self.rate_headers()},
+            )
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            messages = body["messages"]
+            text = self.reply_text(messages)
+            prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(text.split()),
+                "total_tokens": prompt_tokens + len(text.split()),
+                "prompt_tokens_details": {"cached_tokens": 0},
+            }
+            if not body.get("stream"):
+                await asyncio.sleep(self.first_token + self.per_token * len(text.split()))
+                return web.json_response(self.completion(body["model"], text, usage), headers=self.rate_headers())
+            return await self.stream(request, body, text, usage)
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, request, body: dict, text: str, usage: dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", **self.rate_headers()})
+        await response.prepare(request)
+        await asyncio.sleep(self.first_token)
+        created = int(time.time())
+
+        async def event(payload: dict):
+            await response.write(f"data: {json.dumps(payload)}\n\n".encode())
+
+        def chunk(delta: dict, finish_reason=None) -> dict:
+            return {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                    "model": body["model"], "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        await event(chunk({"role": "assistant", "content": ""}))
+        for word in text.split(" "):
+            await event(chunk({"content": word + " "}))
+            if self.per_token:
+                await asyncio.sleep(self.per_token)
+        await event(chunk({}, "stop"))
+        if body.get("stream_options", {}).get("include_usage"):
+            await event({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                         "model": body["model"], "choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def completion(model: str, text: str, usage: dict) -> dict:
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
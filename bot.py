@@ -1,31 +1,64 @@
 import os
+import re
+import json
+import time
+import asyncio
 import discord
 import logging
 
+from dotenv import load_dotenv
+
+# Load environment variables first: the modules below read their settings on import
+load_dotenv()
 
 from discord.ext import commands
-from dotenv import load_dotenv
-from agent import GPTAgent
+from agent import LLMAgent
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_BULK, current_generation
+from providers import build_providers
+from workers import LLM_WORKER_PROCESSES, RemoteAgent, RemotePageFetcher, WorkerPool
 
 from discord.ui import Button, View, Modal, TextInput
 from discord import ButtonStyle, TextStyle
 
-import requests
-from bs4 import BeautifulSoup
-import validators
-
-# Global Data Structures
-offers = {}
-user_debate_histories = {}
+from urllib.parse import urlsplit
+from scraper import PageFetcher, normalize_url
+from compaction import HistoryCompactor
+from speculation import SPECULATIVE_GENERATION, Speculator
+from context import DebateContext, HISTORY_WINDOW, PROMPT_TOKEN_BUDGET
+from tokens import count_tokens, warm_up as warm_tokenizer
+from streaming import RoundMessage, StreamingMessage, send_embeds, send_message
+from metrics import EAGER_STARTUP, PROCESS_STARTED, Span, load_eagerly, resident_bytes, serve_metrics, span
+from storage import Store, LazyUserMap, UserStateManager
+
+# Global Data Structures, backed by SQLite and loaded per user on first access
+store = Store()
+offers = LazyUserMap(store.load_offers)
+user_debate_histories = LazyUserMap(lambda user_id: store.load_history(user_id, HISTORY_WINDOW))
+user_summaries = LazyUserMap(store.load_summary)  # user_id -> (summary of older turns, turns it covers)
+debate_contexts = {}  # user_id -> DebateContext (cached prompt context)
+user_generations = {}  # user_id -> task answering the user's latest message
+# Evicts idle users' state from memory; it is reloaded from the store on their next message
+user_state = UserStateManager(store, [offers, user_debate_histories, user_summaries], [debate_contexts])
+offers.on_load = user_debate_histories.on_load = user_summaries.on_load = user_state.touch
+# How companies answer in a round (see !rounds); users without a choice get the default
+ROUND_MODES = ("sequential", "simultaneous", "batched")
+user_round_modes = {}
+user_speculation = {}  # user_id -> whether !go and !advise are precomputed (see !speculate)
+SIMULTANEOUS_ROUNDS_DEFAULT = os.getenv("SIMULTANEOUS_ROUNDS", "").lower() in ("1", "true", "yes")
+ROUND_MODE_DEFAULT = os.getenv("ROUND_MODE", "simultaneous" if SIMULTANEOUS_ROUNDS_DEFAULT else "sequential")
+# !import: fetches in flight per import, fetches in flight per site, and URLs per import
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+IMPORT_PER_HOST = int(os.getenv("IMPORT_PER_HOST", "2"))
+IMPORT_MAX_URLS = 20
+URL_PATTERN = re.compile(r"https?://[^\s<>]+")
+# Stream replies into a placeholder message instead of posting them when complete
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
 
 # Setup logging
 logger = logging.getLogger("discord")
 logger.setLevel(logging.INFO)
 logging.basicConfig()
 
-# Load environment variables
-load_dotenv()
-
 class CustomHelpCommand(commands.HelpCommand):
     async def send_bot_help(self, mapping):
         embed = discord.Embed(title="Bot Commands", description="Here are the available commands:", color=discord.Color.blue())
@@ -49,17 +82,81 @@ class CustomHelpCommand(commands.HelpCommand):
         channel = self.get_destination()
         await channel.send(embed=embed)
 
-# Create the bot
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=CustomHelpCommand())
+if EAGER_STARTUP:
+    # The previous profile: every intent and the default caches (see STARTUP_PROFILE)
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all(), help_command=CustomHelpCommand())
+else:
+    # Create the bot with only what messages, commands and interactions need: no member or
+    # presence events, no member cache and no message cache (replies are sent, never looked up)
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    bot = commands.Bot(
+        command_prefix="!",
+        intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        max_messages=None,
+        chunk_guilds_at_startup=False,
+        help_command=CustomHelpCommand(),
+    )
 
-# Agent
-agent = GPTAgent()
+if LLM_WORKER_PROCESSES > 0:
+    # Split deployment: this process only handles Discord; LLM calls and page fetches run in workers
+    worker_pool = WorkerPool(LLM_WORKER_PROCESSES)
+    agent = RemoteAgent(worker_pool)
+    page_fetcher = RemotePageFetcher(worker_pool)
+else:
+    worker_pool = None
+    # Agent
+    agent = LLMAgent(build_providers())
+    # Pooled, non-blocking fetcher for URL-backed job descriptions
+    page_fetcher = PageFetcher()
+if EAGER_STARTUP:
+    load_eagerly(agent.router.providers if worker_pool is None else ())
+
+def kept_turns(user_id: int) -> int:
+    """Latest turns the user's prompts still show, after trimming; older ones belong to the summary"""
+    context = debate_contexts.get(user_id)
+    return context.kept_turns() if context is not None else HISTORY_WINDOW
+
+def summary_updated(user_id: int, summary: str, folded: int):
+    user_summaries[user_id] = (summary, folded)
+    if user_id in debate_contexts:
+        debate_contexts[user_id].set_summary(summary)
+    agent.response_cache.invalidate(user_id)
+    # Speculative replies were built on the old context
+    speculator.schedule(user_id)
+
+# Folds turns that left the prompt window into a rolling summary while the user is idle
+compactor = HistoryCompactor(store, agent, kept_turns, summary_updated)
+
+def speculation_enabled(user_id: int) -> bool:
+    return user_speculation.get(user_id, SPECULATIVE_GENERATION)
+
+def speculative_requests(user_id: int) -> list:
+    """Prompts of the user's likely next commands: the next !go round, then !advise"""
+    requests = []
+    if offers.get(user_id):
+        requests.extend(next_round_prompts(user_id, log=False))
+    if user_debate_histories.get(user_id):
+        requests.append(advice_prompts(user_id, log=False))
+    return requests
+
+# Precomputes the next !go and !advise at background priority while the user reads
+speculator = Speculator(agent, speculative_requests, speculation_enabled)
 
 # Fetch Discord token
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 
 
+def is_url(text: str) -> bool:
+    import validators  # Only needed once someone submits an offer
+
+    return bool(validators.url(text))
+
+
 class CreateOfferModal(discord.ui.Modal, title="Create New Offer"):
     company_name = discord.ui.TextInput(
         label="Company Name",
@@ -93,21 +190,19 @@ class CreateOfferModal(discord.ui.Modal, title="Create New Offer"):
     )
 
     async def on_submit(self, interaction: discord.Interaction):
+        # Fetching a URL can take longer than the 3 seconds Discord gives a modal to respond
+        await interaction.response.defer()
         try:
             user_id = interaction.user.id
-            if user_id not in offers:
-                offers[user_id] = {}
-
-            offer_id = str(len(offers[user_id]) + 1)
-            while offer_id in offers[user_id]:
-                offer_id = str(int(offer_id) + 1)
+            await user_state.load(user_id)
+            offer_id = next_offer_id(user_id)
 
             job_desc = self.job_description.value
-            if validators.url(job_desc):
+            if is_url(job_desc):
                 logger.info(f"URL detected, fetching content...")
-                job_desc = fetch_website_info(job_desc)
+                job_desc = await page_fetcher.fetch_website_info(job_desc)
                 if job_desc.startswith("Error"):
-                    await interaction.response.send_message(f"Failed to fetch URL content: {job_desc}", ephemeral=True)
+                    await interaction.followup.send(f"Failed to fetch URL content: {job_desc}", ephemeral=True)
                     return
 
             offers[user_id][offer_id] = {
@@ -117,8 +212,9 @@ class CreateOfferModal(discord.ui.Modal, title="Create New Offer"):
                 "job_description": job_desc,
                 "package": self.package.value,
             }
+            await offer_saved(user_id, offer_id)
 
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"**Success!** Created offer `{offer_id}`:\n"
                 f"- Company Name: {self.company_name.value}\n"
                 f"- Job Title: {self.job_title.value}\n"
@@ -128,14 +224,12 @@ class CreateOfferModal(discord.ui.Modal, title="Create New Offer"):
             )
 
             argument = await generate_company_argument(offer_id, user_id)
-            if user_id not in user_debate_histories:
-                user_debate_histories[user_id] = []
-            user_debate_histories[user_id].append((f"Company {self.company_name.value}", argument))
+            record_turn(user_id, f"Company {self.company_name.value}", argument)
             await interaction.followup.send(f"**Initial Response from {self.company_name.value}**:\n{argument}")
 
         except Exception as e:
             logger.error(f"Error in CreateOfferModal: {e}")
-            await interaction.response.send_message("An error occurred while creating the offer.", ephemeral=True)
+            await interaction.followup.send("An error occurred while creating the offer.", ephemeral=True)
 
 class UpdateOfferModal(discord.ui.Modal, title="Update Offer"):
     def __init__(self, offer_id: str, user_id: int):
@@ -181,6 +275,9 @@ class UpdateOfferModal(discord.ui.Modal, title="Update Offer"):
         self.add_item(self.package)
 
     async def on_submit(self, interaction: discord.Interaction):
+        # Fetching a URL can take longer than the 3 seconds Discord gives a modal to respond
+        await interaction.response.defer()
+        await user_state.load(self.user_id)
         updated_fields = {}
 
         if self.company_name.value:
@@ -191,24 +288,25 @@ class UpdateOfferModal(discord.ui.Modal, title="Update Offer"):
             updated_fields["location"] = self.location.value
         if self.job_description.value:
             job_desc = self.job_description.value
-            if validators.url(job_desc):
+            if is_url(job_desc):
                 logger.info(f"URL detected, fetching content...")
-                job_desc = fetch_website_info(job_desc)
+                job_desc = await page_fetcher.fetch_website_info(job_desc)
                 if job_desc.startswith("Error"):
-                    await interaction.response.send_message(f"Failed to fetch URL content: {job_desc}", ephemeral=True)
+                    await interaction.followup.send(f"Failed to fetch URL content: {job_desc}", ephemeral=True)
                     return
             updated_fields["job_description"] = job_desc
         if self.package.value:
             updated_fields["package"] = self.package.value
 
         if not updated_fields:
-            await interaction.response.send_message("No changes were made.", ephemeral=True)
+            await interaction.followup.send("No changes were made.", ephemeral=True)
             return
 
         offers[self.user_id][self.offer_id].update(updated_fields)
+        await offer_saved(self.user_id, self.offer_id)
 
         update_msg = "\n".join([f"- **{key.capitalize()}**: {value[:200]}" for key, value in updated_fields.items()])
-        await interaction.response.send_message(f"**Updated Offer `{self.offer_id}`**:\n{update_msg}")
+        await interaction.followup.send(f"**Updated Offer `{self.offer_id}`**:\n{update_msg}")
 
 @bot.tree.command(name="create", description="Create a new job offer")
 async def create(interaction: discord.Interaction):
@@ -218,6 +316,7 @@ async def create(interaction: discord.Interaction):
 @bot.tree.command(name="update", description="Update an existing offer")
 async def update(interaction: discord.Interaction, offer_id: str):
     user_id = interaction.user.id
+    await user_state.load(user_id)
     if user_id not in offers or offer_id not in offers[user_id]:
         await interaction.response.send_message(f"No offer found with ID `{offer_id}`.", ephemeral=True)
         return
@@ -225,22 +324,22 @@ async def update(interaction: discord.Interaction, offer_id: str):
     modal = UpdateOfferModal(offer_id, user_id)
     await interaction.response.send_modal(modal)
 
-def fetch_website_info(url: str) -> str:
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        paragraphs = [p.get_text() for p in soup.find_all('p')]
-        extracted_text = "\n".join(paragraphs)
-        return extracted_text if extracted_text else "No meaningful content found."
-
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching website: {e}"
-    
+@bot.before_invoke
+async def before_command(ctx: commands.Context):
+    await user_state.load(ctx.author.id)
+    # Trace the command; LLM calls it queues are recorded under the same trace id
+    ctx.span = Span.start(f"!{ctx.command.qualified_name}", user=ctx.author.id)
+
+@bot.after_invoke
+async def after_command(ctx: commands.Context):
+    ctx.span.end()
+
 @bot.event
 async def on_ready():
-    logger.info(f"{bot.user} has connected to Discord!")
+    logger.info(
+        f"{bot.user} has connected to Discord! Ready {time.time() - PROCESS_STARTED:.1f}s after start, "
+        f"{resident_bytes() / 2**20:.0f} MiB resident"
+    )
     try:
         synced = await bot.tree.sync()
         logger.info(f"Synced {len(synced)} command(s)")
@@ -256,21 +355,18 @@ async def on_message(message: discord.Message):
         await bot.process_commands(message)
         return
 
-    logger.info(f"Processing normal message from {message.author}: {message.content}")
+    # Message content stays out of the logs; it is user data and this is the hot path
+    logger.debug(f"Processing normal message from user {message.author.id} ({len(message.content)} chars)")
 
-    if message.author.id not in user_debate_histories:
-        user_debate_histories[message.author.id] = []
+    with span("message", user=message.author.id):
+        await user_state.load(message.author.id)
+        record_turn(message.author.id, message.author.display_name, message.content)
 
-    user_debate_histories[message.author.id].append((message.author.display_name, message.content))
-
-    if message.author.id in offers and offers[message.author.id]:
-        await message.reply("**Companies respond to your message:**")
-        for oid in offers[message.author.id]:
-            argument = await generate_company_argument(oid, message.author.id)
-            user_debate_histories[message.author.id].append((f"Company {offers[message.author.id][oid]['name']}", argument))
-            await message.reply(f"**{offers[message.author.id][oid]['name']} (Offer ID {oid})**:\n{argument}")
-    else:
-        await message.reply("No offers available to debate! Use `/create` to add some offers first.")
+        if message.author.id in offers and offers[message.author.id]:
+            await run_superseding(message.author.id, run_debate_round(
+                message.author.id, message.reply, title="Companies respond to your message"))
+        else:
+            await message.reply("No offers available to debate! Use `/create` to add some offers first.")
 
 @bot.command(name="go", help="Continue the debate for one round (all companies speak)")
 async def continue_debate(ctx: commands.Context, offer_id: int = None):
@@ -289,94 +385,527 @@ async def continue_debate(ctx: commands.Context, offer_id: int = None):
         user_debate_histories[user_id] = []
 
     if offer_id is None:
-        for oid in offers[user_id]:
-            argument = await generate_company_argument(oid, user_id)
-            user_debate_histories[user_id].append((f"Company {offers[user_id][oid]['name']}", argument))
-            await ctx.send(f"**{offers[user_id][oid]['name']} (Offer ID {oid})**:\n{argument}")
+        if speculation_enabled(user_id):
+            speculator.claim(user_id, next_round_prompts(user_id, log=False))
+        await run_debate_round(user_id, ctx.send, PRIORITY_BULK)
         return
 
     if str(offer_id) not in offers[user_id]:
         await ctx.send(f"No offer found with ID {offer_id}.")
         return
 
+    if speculation_enabled(user_id):
+        speculator.claim(user_id, [build_company_prompts(str(offer_id), user_id, log=False)])
     company_data = offers[user_id][str(offer_id)]
-    argument = await generate_company_argument(offer_id, user_id)
-
-    user_debate_histories[user_id].append((f"Company {company_data['name']}", argument))
-    await ctx.send(f"**{company_data['name']} (Offer ID {offer_id})**:\n{argument}")
+    argument = await respond_as_company(str(offer_id), user_id, ctx.send, priority=PRIORITY_BULK)
+    record_turn(user_id, f"Company {company_data['name']}", argument)
+    speculator.schedule(user_id)
 
-def build_debate_context(user_id: int) -> str:
+@bot.command(name="rounds", help="Choose how companies answer: sequential, simultaneous or batched")
+async def set_round_mode(ctx: commands.Context, mode: str = None):
     """
-    Constructs a structured context string that includes:
-      1) A summary of all current job offers for the user.
-      2) The debate history, including arguments from companies and user responses.
+    !rounds - Show the current round mode
+    !rounds simultaneous - All companies respond concurrently to the same context
+    !rounds sequential - Each company responds in turn, seeing earlier replies
+    !rounds batched - One call writes every company's reply (cheapest; replies arrive together)
     """
+    user_id = ctx.author.id
+    if mode is None:
+        await ctx.send(f"Round mode is `{round_mode(user_id)}`.")
+        return
 
-    offers_summary_lines = ["### Current Job Offers Under Consideration ###\n"]
-    if user_id not in offers or not offers[user_id]:
-        offers_summary_lines.append("No job offers available.\n")
-    else:
-        for oid, data in offers[user_id].items():
-            offers_summary_lines.append(
-                f"**Offer ID:** {oid}\n"
-                f"**Company:** {data['name']}\n"
-                f"**Job Title:** {data['title']}\n"
-                f"**Location:** {data['location']}\n"
-                f"**Job Description:** {data['job_description']}\n"
-                f"**Compensation Package:** {data['package']}\n"
-            )
-    offers_summary = f"\n{'-'*40}".join(offers_summary_lines)
+    mode = mode.lower()
+    if mode not in ROUND_MODES:
+        await ctx.send("Unknown mode. Use `!rounds sequential`, `!rounds simultaneous` or `!rounds batched`.")
+        return
+    user_round_modes[user_id] = mode
+    await ctx.send(f"Round mode set to `{mode}`.")
 
-    debate_lines = ["### Debate History ###\n"]
-    user_history = user_debate_histories.get(user_id, [])[-20:]
-    if not user_history:
-        debate_lines.append("No debate has occurred yet.")
-    else:
-        for speaker, text in user_history:
-            debate_lines.append(f"[{speaker}]: {text}")
+def round_mode(user_id: int) -> str:
+    return user_round_modes.get(user_id, ROUND_MODE_DEFAULT)
 
-    debate_text = "\n".join(debate_lines)
-    context_str = f"{offers_summary}\n\n{'='*40}\n\n{debate_text}"
+@bot.command(name="speculate", help="Precompute your next !go and !advise in the background (on/off)")
+async def set_speculation(ctx: commands.Context, setting: str = None):
+    """
+    !speculate - Show whether speculative generation is on
+    !speculate on - After each round, generate the next round and advice while you read,
+                    so !go and !advise answer at once if nothing changed in between
+    !speculate off - Only call the LLM when you ask
+    """
+    user_id = ctx.author.id
+    if setting is None:
+        await ctx.send(f"Speculative generation is {'on' if speculation_enabled(user_id) else 'off'}.")
+        return
 
-    return context_str
+    setting = setting.lower()
+    if setting not in ("on", "off"):
+        await ctx.send("Use `!speculate on` or `!speculate off`.")
+        return
+    user_speculation[user_id] = setting == "on"
+    if user_speculation[user_id] and user_debate_histories.get(user_id):
+        speculator.schedule(user_id)
+    else:
+        speculator.discard(user_id)
+    await ctx.send(f"Speculative generation turned {setting}.")
 
+async def run_superseding(user_id: int, coro):
+    """
+    Run a reply generation as the user's current one. A newer message supersedes it:
+    the old round is cancelled and its queued LLM requests are withdrawn before they
+    use rate-limit slots. Other requests of the user (!advise, compaction, speculation)
+    are left alone. The new round's context already holds every message, so rapid
+    messages are answered together.
+    """
+    previous = user_generations.get(user_id)
+    if previous is not None and not previous.done():
+        previous.cancel()
+        withdrawn = agent.cancel_pending(user_id, previous)
+        logger.info(f"Superseded generation for user {user_id}, withdrew {withdrawn} queued request(s)")
+
+    task = asyncio.create_task(as_generation(coro))
+    user_generations[user_id] = task
+    try:
+        await task
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+        # Superseded by a newer message; that round replies instead
+    finally:
+        if user_generations.get(user_id) is task:
+            del user_generations[user_id]
+
+async def as_generation(coro):
+    """Run coro with its LLM requests tagged as this task's generation (see run_superseding)"""
+    current_generation.set(asyncio.current_task())
+    return await coro
+
+def company_header(offer_id, company_name: str) -> str:
+    return f"**{company_name} (Offer ID {offer_id})**:\n"
+
+async def respond_as_company(offer_id: str, user_id: int, send, context=None,
+                             priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Generate one company's argument and post it with `send`, streaming if enabled"""
+    header = company_header(offer_id, offers[user_id][offer_id]['name'])
+    if STREAM_REPLIES:
+        reply = await StreamingMessage.send(send, header)
+        return await stream_company_argument(offer_id, user_id, reply, context=context, priority=priority)
+
+    argument = await generate_company_argument(offer_id, user_id, context=context, priority=priority)
+    await send_message(send, f"{header}{argument}")
+    return argument
+
+async def run_debate_round(user_id: int, send, priority: int = PRIORITY_INTERACTIVE, title: str = "Debate round"):
+    """
+    Lets every company in the user's offers respond once. The replies are posted with
+    `send` as one RoundMessage (paginated embeds) rather than one message per company.
+    `priority` is the scheduling class: replies to a new message are interactive, !go is bulk.
+    Sequential rounds let each company see the replies before it; simultaneous rounds
+    answer from one shared context snapshot so latency is that of the slowest call;
+    batched rounds send that snapshot once and get every reply from a single call,
+    falling back to a simultaneous round if the batched output is unusable.
+    """
+    mode = round_mode(user_id)
+    round_offers = ordered_round_offers(user_id, mode)
+    round_message = RoundMessage(send, title, [company_header(oid, data['name']) for oid, data in round_offers])
+    try:
+        if mode == "sequential":
+            if STREAM_REPLIES:
+                await round_message.start()
+            for i, (oid, data) in enumerate(round_offers):
+                if STREAM_REPLIES:
+                    argument = await stream_company_argument(oid, user_id, round_message.section(i), priority=priority)
+                else:
+                    argument = await generate_company_argument(oid, user_id, priority=priority)
+                    await round_message.set(i, argument)
+                record_turn(user_id, f"Company {data['name']}", argument)
+            await round_message.finish()
+            speculator.schedule(user_id)
+            return
 
-async def generate_company_argument(offer_id: int, user_id: int, user_msg=None) -> str:
+        arguments = None
+        context = round_context(user_id, round_offers, mode)
+        if mode == "batched" and len(round_offers) > 1:
+            arguments = await run_batched_round(user_id, round_message, round_offers, context, priority)
+        if arguments is None:
+            arguments = await run_simultaneous_round(user_id, round_message, round_offers, context, priority)
+        await round_message.finish()
+    except BaseException:
+        # Show what was streamed before the round was superseded or failed
+        if round_message.messages:
+            await round_message.finish()
+        raise
+
+    for (oid, data), argument in zip(round_offers, arguments):
+        record_turn(user_id, f"Company {data['name']}", argument)
+    speculator.schedule(user_id)
+
+def ordered_round_offers(user_id: int, mode: str) -> list:
+    if mode == "sequential":
+        return list(offers[user_id].items())
+    return sorted(offers[user_id].items(), key=lambda item: int(item[0]))
+
+def round_context(user_id: int, round_offers: list, mode: str):
+    """The context snapshot every company in a simultaneous or batched round answers from"""
+    if mode == "batched" and len(round_offers) > 1:
+        # One snapshot that fits both prompt shapes, so a fallback round sees the same context
+        return build_debate_context(user_id, max(company_prompt_reserve(user_id), batched_prompt_reserve(round_offers)))
+    return build_debate_context(user_id, company_prompt_reserve(user_id))
+
+def next_round_prompts(user_id: int, log: bool = True) -> list:
     """
-    Uses the agent to produce a custom argument from a specific company's perspective,
-    given the entire debate context so far.
+    (system_prompt, user_prompt) pairs the next round starts with, as run_debate_round
+    would build them now. Sequential rounds only know the first company's prompt in
+    advance; the others depend on the replies before them. `log` as for build_company_prompts.
+    """
+    mode = round_mode(user_id)
+    round_offers = ordered_round_offers(user_id, mode)
+    if not round_offers:
+        return []
+    if mode == "sequential":
+        return [build_company_prompts(round_offers[0][0], user_id, log=log)]
+    context = round_context(user_id, round_offers, mode)
+    if mode == "batched" and len(round_offers) > 1:
+        return [batched_round_prompts(round_offers, context)]
+    return [build_company_prompts(oid, user_id, context=context, log=log) for oid, _ in round_offers]
+
+async def run_simultaneous_round(user_id: int, round_message: RoundMessage, round_offers: list, context,
+                                 priority: int) -> list:
+    """Every company answers concurrently from `context`; returns the arguments in round order"""
+    tasks = []
+    arguments = []
+    try:
+        if STREAM_REPLIES:
+            # The round goes out with placeholders, then every reply streams into its section
+            await round_message.start()
+            tasks = [
+                asyncio.create_task(stream_company_argument(oid, user_id, round_message.section(i), context=context,
+                                                            priority=priority))
+                for i, (oid, _) in enumerate(round_offers)
+            ]
+            arguments = await asyncio.gather(*tasks)
+        else:
+            tasks = [
+                asyncio.create_task(generate_company_argument(oid, user_id, context=context, priority=priority))
+                for oid, _ in round_offers
+            ]
+            # Fill in offer-ID order, each as soon as it and the ones before it are done
+            for i, task in enumerate(tasks):
+                argument = await task
+                arguments.append(argument)
+                await round_message.set(i, argument)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return arguments
+
+async def run_batched_round(user_id: int, round_message: RoundMessage, round_offers: list, context, priority: int):
+    """
+    Asks for every company's argument in one completion (JSON keyed by offer ID) and
+    fills them into the round. Returns the arguments, or None if the output did not
+    parse into one non-empty argument per offer.
+    """
+    system_prompt, user_prompt = batched_round_prompts(round_offers, context)
+    input_tokens = context[1] + count_tokens(DEBATE_INSTRUCTIONS) + count_tokens(user_prompt) + 1
+    logger.info(f"Batched round for user {user_id}, {len(round_offers)} offers: {input_tokens} input tokens")
+
+    raw = await agent.generate_custom_response(system_prompt, user_prompt, user_id=user_id, priority=priority)
+    parsed = parse_batched_round(raw, [oid for oid, _ in round_offers])
+    if parsed is None:
+        logger.warning(f"Batched round for user {user_id} returned unusable output, falling back to per-company calls")
+        # Otherwise the next identical !go would be served the same unusable reply
+        agent.uncache_custom_response(system_prompt, user_prompt)
+        return None
+
+    arguments = [parsed[oid] for oid, _ in round_offers]
+    for i, argument in enumerate(arguments):
+        await round_message.set(i, argument, show=False)
+    return arguments
+
+def batched_round_prompts(round_offers: list, context) -> tuple:
+    """(system_prompt, user_prompt) asking for every company's argument from the `context` snapshot"""
+    return f"{DEBATE_INSTRUCTIONS}{context[0]}\n", batched_user_prompt(round_offers)
+
+def get_debate_context(user_id: int) -> DebateContext:
+    if user_id not in debate_contexts:
+        summary, _ = user_summaries.get(user_id, (None, 0))
+        debate_contexts[user_id] = DebateContext(user_debate_histories.get(user_id, [])[-HISTORY_WINDOW:],
+                                                 summary=summary)
+    return debate_contexts[user_id]
+
+def record_turn(user_id: int, speaker: str, text: str):
+    """Append a turn to the user's history and to their cached prompt context"""
+    user_state.touch(user_id)
+    if user_id not in user_debate_histories:
+        user_debate_histories[user_id] = []
+    history = user_debate_histories[user_id]
+    history.append((speaker, text))
+    # Only the prompt window stays in memory; the full history is in the store
+    if len(history) > HISTORY_WINDOW:
+        del history[:-HISTORY_WINDOW]
+    get_debate_context(user_id).append_turn(speaker, text)
+    store.append_history(user_id, speaker, text)
+    compactor.schedule(user_id)
+    speculator.discard(user_id)
+    # Cached replies were built from the old history. Advice turns are the exception:
+    # they are left out of the advice prompt, so a repeated !advise can still hit.
+    if speaker != ADVICE_SPEAKER:
+        agent.response_cache.invalidate(user_id)
+
+def invalidate_offers(user_id: int):
+    """Drop the cached offers block after /create, /update or !remove"""
+    if user_id in debate_contexts:
+        debate_contexts[user_id].invalidate_offers()
+    agent.response_cache.invalidate(user_id)
+    speculator.discard(user_id)
+
+async def offer_saved(user_id: int, offer_id: str):
+    """Persist a created or updated offer and refresh the prompt context"""
+    await store.save_offer(user_id, offer_id, offers[user_id][offer_id])
+    invalidate_offers(user_id)
+
+def next_offer_id(user_id: int) -> str:
+    """Lowest free offer ID after the user's offer count"""
+    if user_id not in offers:
+        offers[user_id] = {}
+    offer_id = str(len(offers[user_id]) + 1)
+    while offer_id in offers[user_id]:
+        offer_id = str(int(offer_id) + 1)
+    return offer_id
+
+async def offer_removed(user_id: int, offer_id: str):
+    await store.delete_offer(user_id, offer_id)
+    invalidate_offers(user_id)
+
+def build_debate_context(user_id: int, reserved_tokens: int = 0, skip_trailing: str = None):
     """
-    context = build_debate_context(user_id)
-    system_prompt = (
-        "You are facilitating a competitive hiring debate between multiple companies trying to recruit a candidate.\n"
-        "Each company must respond to prior arguments made by competitors while emphasizing its unique advantages.\n"
-        "The candidate has shared their preferences and concerns, which should be prioritized when crafting responses.\n"
-        "If the candidate has just asked a question, companies must address it directly before presenting their own arguments.\n"
-        "Stay in-character as the 'debate organizer,' ensuring companies remain persuasive and relevant.\n\n"
-        "Context so far:\n"
-        f"{context}\n"
+    Constructs a structured context string that includes:
+      1) A summary of all current job offers for the user.
+      2) The debate history, including arguments from companies and user responses.
+    The context is trimmed to fit PROMPT_TOKEN_BUDGET minus `reserved_tokens` (the rest
+    of the prompt), cached per user and only rebuilt when offers or history change.
+    Trailing turns by `skip_trailing` are left out. Returns (context, token count).
+    """
+    budget = PROMPT_TOKEN_BUDGET - reserved_tokens
+    return get_debate_context(user_id).render(offers.get(user_id), budget, skip_trailing)
+
+DEBATE_INSTRUCTIONS = (
+    "You are facilitating a competitive hiring debate between multiple companies trying to recruit a candidate.\n"
+    "Each company must respond to prior arguments made by competitors while emphasizing its unique advantages.\n"
+    "The candidate has shared their preferences and concerns, which should be prioritized when crafting responses.\n"
+    "If the candidate has just asked a question, companies must address it directly before presenting their own arguments.\n"
+    "Stay in-character as the 'debate organizer,' ensuring companies remain persuasive and relevant.\n\n"
+    "Context so far:\n"
+)
+
+COMPANY_GUIDELINES = (
+    "1. If the candidate has asked a question, **begin by answering it concisely and convincingly**.\n"
+    "2. Respond to competing companies' arguments, pointing out weaknesses or gaps in their offers.\n"
+    "3. Emphasize how your offer uniquely meets the candidate's stated preferences and priorities.\n"
+    "4. Address any concerns raised by the candidate, reinforcing why your company is the best choice.\n"
+    "5. Keep your response engaging and to the point, within 600 characters.\n"
+)
+
+def company_user_prompt(offer_id, company_name: str, user_msg=None) -> str:
+    user_prompt = (
+        f"Generate a persuasive counter-argument on behalf of '{company_name}' (offer ID: {offer_id}).\n"
+        f"{COMPANY_GUIDELINES}"
     )
 
+    if user_msg:
+        user_prompt += f"\nThe candidate's most recent question or concern: \"{user_msg}\"\n"
+    return user_prompt
+
+def company_prompt_reserve(user_id: int) -> int:
+    """Tokens used by everything but the context in the largest company prompt for this user"""
+    longest = max((data['name'] for data in offers.get(user_id, {}).values()), key=len, default="")
+    return count_tokens(DEBATE_INSTRUCTIONS) + count_tokens(company_user_prompt("00", longest)) + 1
+
+
+def batched_user_prompt(round_offers: list) -> str:
+    companies = "".join(f"- '{data['name']}' (offer ID: {oid})\n" for oid, data in round_offers)
+    example = ", ".join(f'"{oid}": "..."' for oid, _ in round_offers)
+    return (
+        "Generate a persuasive counter-argument on behalf of each of these companies:\n"
+        f"{companies}"
+        "Each company speaks only for itself and follows these rules:\n"
+        f"{COMPANY_GUIDELINES}"
+        "Reply with only a JSON object that maps each offer ID to that company's argument, "
+        f"like {{{example}}}.\n"
+    )
+
+def batched_prompt_reserve(round_offers: list) -> int:
+    """Tokens used by everything but the context in the batched round prompt"""
+    return count_tokens(DEBATE_INSTRUCTIONS) + count_tokens(batched_user_prompt(round_offers)) + 1
+
+def parse_batched_round(raw: str, offer_ids: list):
+    """{offer_id: argument} from a batched reply, or None unless every offer has a non-empty argument"""
+    start, end = raw.find("{"), raw.rfind("}")  # Tolerates code fences and stray prose
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(raw[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    arguments = {}
+    for oid in offer_ids:
+        argument = data.get(str(oid))
+        if not isinstance(argument, str) or not argument.strip():
+            return None
+        arguments[oid] = argument.strip()
+    return arguments
+
+def build_company_prompts(offer_id, user_id: int, user_msg=None, context=None, log: bool = True):
+    """
+    Returns (system_prompt, user_prompt) for one company's argument, or None if the
+    offer does not exist. Uses the current debate context, or the (context, tokens)
+    snapshot passed in. Speculative and cache-lookup builds pass log=False: only
+    prompts that are actually sent are logged.
+    """
     company_data = offers[user_id].get(offer_id)
     if not company_data:
+        return None
+
+    # Prompt layout keeps a stable, cacheable prefix shared by every company in a round
+    # (fixed instructions, then offers, then history) and puts only the per-company
+    # request in the user prompt, so provider prompt caching can reuse the prefix.
+    user_prompt = company_user_prompt(offer_id, company_data['name'], user_msg)
+    if context is None:
+        context = build_debate_context(user_id, company_prompt_reserve(user_id))
+    context_text, context_tokens = context
+    system_prompt = f"{DEBATE_INSTRUCTIONS}{context_text}\n"
+
+    if log:
+        input_tokens = context_tokens + count_tokens(DEBATE_INSTRUCTIONS) + count_tokens(user_prompt) + 1
+        logger.info(f"Company argument for user {user_id}, offer {offer_id}: {input_tokens} input tokens")
+    return system_prompt, user_prompt
+
+async def generate_company_argument(offer_id: int, user_id: int, user_msg=None, context=None,
+                                    priority: int = PRIORITY_INTERACTIVE) -> str:
+    """
+    Uses the agent to produce a custom argument from a specific company's perspective,
+    given the entire debate context so far.
+    """
+    prompts = build_company_prompts(offer_id, user_id, user_msg, context)
+    if prompts is None:
         return f"No company found with ID {offer_id}."
 
-    user_prompt = (
-        f"Generate a persuasive counter-argument on behalf of '{company_data['name']}' (offer ID: {offer_id}).\n"
-        "1. If the candidate has asked a question, **begin by answering it concisely and convincingly**.\n"
-        "2. Respond to competing companies' arguments, pointing out weaknesses or gaps in their offers.\n"
-        "3. Emphasize how your offer uniquely meets the candidate's stated preferences and priorities.\n"
-        "4. Address any concerns raised by the candidate, reinforcing why your company is the best choice.\n"
-        "5. Keep your response engaging and to the point, within 600 characters.\n"
-    )
+    response_text = await agent.generate_custom_response(*prompts, user_id=user_id, priority=priority)
+    return response_text
 
-    if user_msg:
-        user_prompt += f"\nThe candidate's most recent question or concern: \"{user_msg}\"\n"
+async def stream_company_argument(offer_id, user_id: int, reply: StreamingMessage, user_msg=None, context=None,
+                                  priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Streaming counterpart of generate_company_argument, rendered into `reply` (a message or a RoundSection)"""
+    prompts = build_company_prompts(offer_id, user_id, user_msg, context)
+    if prompts is None:
+        return await reply.finish(f"No company found with ID {offer_id}.")
 
-    response_text = await agent.generate_custom_response(system_prompt, user_prompt)
-    return response_text
+    return await reply.consume(agent.generate_custom_response_stream(*prompts, user_id=user_id, priority=priority))
 
 
+@bot.command(name="import", help="Create offers from many job posting URLs at once")
+async def import_offers(ctx: commands.Context, *, urls: str = ""):
+    """
+    !import <url> <url> ...
+    URLs may be separated by spaces or pasted one per line. The pages are fetched
+    concurrently, IMPORT_CONCURRENCY at a time and IMPORT_PER_HOST per site. One
+    progress message is edited as they finish, then an offer is created for every
+    page that could be read. Failed URLs are listed with their reason.
+    """
+    user_id = ctx.author.id
+    # Keyed by the normalized URL, so the same posting pasted twice is fetched once
+    found = {normalize_url(url): url for url in (u.rstrip(").,;>") for u in URL_PATTERN.findall(urls))}
+    if not found:
+        await ctx.send("Usage: `!import <url> <url> ...`, or paste a list of job posting URLs after `!import`.")
+        return
+    targets = list(found.values())[:IMPORT_MAX_URLS]
+    skipped = len(found) - len(targets)
+
+    statuses = {url: "queued" for url in targets}
+    results = {}  # url -> offer fields, or the reason the page could not be used
+    header = f"**Importing {len(targets)} job posting(s)**" + (f" (skipped {skipped} over the limit)" if skipped else "")
+    progress = await StreamingMessage.send(ctx.send, header + "\n")
+
+    def render() -> str:
+        done = sum(1 for url in targets if url in results)
+        lines = [f"{done}/{len(targets)} done"]
+        for url in targets:
+            result = results.get(url)
+            if result is None:
+                lines.append(f"- {short_url(url)}: {statuses[url]}")
+            elif isinstance(result, dict):
+                lines.append(f"- {short_url(url)}: {result['title']} at {result['name']}")
+            else:
+                lines.append(f"- {short_url(url)}: failed ({result[:80]})")
+        return "\n".join(lines)
+
+    host_limits = {}
+    concurrency = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def import_one(url: str):
+        # Per-site slot first, so a busy site never holds one of the shared slots while it waits
+        host_limit = host_limits.setdefault(urlsplit(url).hostname, asyncio.Semaphore(IMPORT_PER_HOST))
+        async with host_limit, concurrency:
+            statuses[url] = "fetching"
+            try:
+                text = await page_fetcher.fetch_website_info(url)
+            except Exception as e:
+                text = f"Error fetching website: {e}"
+        results[url] = offer_from_page(url, text)
+        if progress.edit_slot_free():
+            await progress.edit(render())
+
+    with span("import", user=user_id, urls=len(targets)):
+        await asyncio.gather(*(import_one(url) for url in targets))
+
+    created = []
+    for url in targets:
+        if isinstance(results[url], dict):
+            offer_id = next_offer_id(user_id)
+            offers[user_id][offer_id] = results[url]
+            await store.save_offer(user_id, offer_id, results[url])
+            created.append(offer_id)
+    if created:
+        invalidate_offers(user_id)
+    await progress.complete(render())
+
+    if created:
+        await ctx.send(
+            f"**Created {len(created)} offer(s):** {', '.join(f'`{oid}`' for oid in created)}. "
+            "Check them with `!list`, fix any details with `/update`, then start the debate with `!go`."
+        )
+    else:
+        await ctx.send("No offers were created; none of the pages could be read.")
+
+def short_url(url: str, limit: int = 60) -> str:
+    parts = urlsplit(url)
+    text = f"{parts.hostname}{parts.path}".rstrip("/")
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def posting_field(text: str, label: str) -> str:
+    """A field of the `Label: value` summary that the page extractor produces"""
+    match = re.search(rf"^{label}: (.+)$", text, re.M)
+    return match.group(1).strip() if match else ""
+
+def offer_from_page(url: str, text: str):
+    """Offer fields for an imported page, or a string saying why the page is unusable"""
+    if text.startswith("Error"):
+        return text
+    if text == "No meaningful content found.":
+        return "no job posting found on the page"
+    # Without a Company field, name the offer after the site (e.g. "Northwind" for jobs.northwind.com)
+    host = (urlsplit(url).hostname or "").removeprefix("www.")
+    labels = host.split(".")
+    site = labels[-2].capitalize() if len(labels) >= 2 and not host.replace(".", "").isdigit() else host
+    return {
+        "name": posting_field(text, "Company") or site or "Unknown company",
+        "title": posting_field(text, "Title") or "Unknown title",
+        "location": posting_field(text, "Location") or "Not listed",
+        "job_description": text,
+        "package": posting_field(text, "Salary") or "Not listed",
+    }
+
 @bot.command(name="remove", help="Remove an existing offer")
 async def remove_offer(ctx: commands.Context, offer_id: int):
     if str(offer_id) not in offers[ctx.author.id]:
@@ -384,6 +913,7 @@ async def remove_offer(ctx: commands.Context, offer_id: int):
         return
 
     removed_offer = offers[ctx.author.id].pop(str(offer_id))
+    await offer_removed(ctx.author.id, str(offer_id))
     await ctx.send(
         f"**Removed** offer `{offer_id}` from consideration:\n"
         f"- Company: {removed_offer['name']}"
@@ -400,21 +930,37 @@ async def list_all_offers(ctx: commands.Context):
         await ctx.send("No offers are currently available.")
         return
 
-    lines = ["**Currently Available Offers:**\n"]
-    for oid, data in offers[user_id].items():
-        lines.append(
-            f"**Offer ID:** {oid}\n"
-            f"**Company Name:** {data['name']}\n"
+    sections = [
+        (
+            f"**Offer ID {oid}: {data['name']}**\n",
             f"**Title:** {data['title']}\n"
             f"**Location:** {data['location']}\n"
             f"**Job Description:**\n{data['job_description'][:200]}...\n"
-            f"**Package:** {data['package']}\n"
-            "--------------------------------------\n"
+            f"**Package:** {data['package']}",
         )
-
-    message_text = "\n".join(lines)
-    await ctx.send(message_text)
-
+        for oid, data in offers[user_id].items()
+    ]
+    # Paginated embeds: any number of offers fits, where one 2000-character message did not
+    await send_embeds(ctx.send, "Currently Available Offers", sections)
+
+
+ADVICE_SPEAKER = "Bot's Advice"
+ADVICE_INSTRUCTIONS = (
+    "You are an expert career advisor helping a candidate choose between multiple job offers. "
+    "Your goal is to provide a **personalized** recommendation based on the candidate's **stated priorities** "
+    "and the arguments presented by competing companies.\n\n"
+    "Carefully analyze:\n"
+    "1. The candidate's preferences, concerns, and priorities mentioned in the debate.\n"
+    "2. The strengths and weaknesses of each company's offer.\n"
+    "3. How well each company has addressed the candidate's concerns.\n\n"
+    "Your response should be clear, concise, and **directly reference what the candidate and companies have discussed**.\n\n"
+    "Context so far:\n"
+)
+ADVICE_USER_PROMPT = (
+    "Summarize the discussion and recommend the **best** job offer for the candidate. "
+    "Base your recommendation on **the candidate's concerns and priorities**, as well as the company arguments.\n"
+    "Your response should be **less than 600 characters** and **directly address what was discussed**."
+)
 
 @bot.command(name="advise", help="Summarizes the conversation and suggests which offer to choose")
 async def advise(ctx):
@@ -424,30 +970,118 @@ async def advise(ctx):
         await ctx.send("You haven't discussed any offers yet. Start a discussion before asking for advice!")
         return
 
-    context = build_debate_context(user_id)
-
-    system_prompt = (
-        "You are an expert career advisor helping a candidate choose between multiple job offers. "
-        "Your goal is to provide a **personalized** recommendation based on the candidate's **stated priorities** "
-        "and the arguments presented by competing companies.\n\n"
-        "Carefully analyze:\n"
-        "1. The candidate's preferences, concerns, and priorities mentioned in the debate.\n"
-        "2. The strengths and weaknesses of each company's offer.\n"
-        "3. How well each company has addressed the candidate's concerns.\n\n"
-        "Your response should be clear, concise, and **directly reference what the candidate and companies have discussed**."
-    )
+    system_prompt, user_prompt = advice_prompts(user_id)
+    if speculation_enabled(user_id):
+        speculator.claim(user_id, [(system_prompt, user_prompt)])
 
-    user_prompt = (
-        "Summarize the discussion and recommend the **best** job offer for the candidate. "
-        "Base your recommendation on **the candidate's concerns and priorities**, as well as the company arguments.\n\n"
-        "Context so far:\n"
-        f"{context}\n"
-        "Your response should be **less than 600 characters** and **directly address what was discussed**."
+    if STREAM_REPLIES:
+        reply = await StreamingMessage.send(ctx.send, "**Bot's Advice:**\n")
+        advice = await reply.consume(agent.generate_custom_response_stream(system_prompt, user_prompt, user_id=user_id))
+    else:
+        advice = await agent.generate_custom_response(system_prompt, user_prompt, user_id=user_id)
+        await send_message(ctx.send, f"**Bot's Advice:**\n{advice}")
+    if user_debate_histories[user_id][-1] != (ADVICE_SPEAKER, advice):
+        record_turn(user_id, ADVICE_SPEAKER, advice)
+    speculator.schedule(user_id)
+
+def advice_prompts(user_id: int, log: bool = True) -> tuple:
+    """(system_prompt, user_prompt) for !advise from the current debate; `log` as for build_company_prompts"""
+    # Same layout as company prompts: cacheable prefix (instructions, offers, history) in
+    # the system prompt, the small request-specific part in the user prompt
+    instructions_tokens = count_tokens(ADVICE_INSTRUCTIONS) + count_tokens(ADVICE_USER_PROMPT) + 1
+    # Earlier advice right at the end of the history is left out so that re-running
+    # !advise with nothing new in between asks the identical (cached) question
+    context, context_tokens = build_debate_context(user_id, instructions_tokens, skip_trailing=ADVICE_SPEAKER)
+    if log:
+        logger.info(f"Advice for user {user_id}: {instructions_tokens + context_tokens} input tokens")
+    return f"{ADVICE_INSTRUCTIONS}{context}\n", ADVICE_USER_PROMPT
+
+@bot.command(name="stats", help="Show bot performance statistics (administrators only)")
+@commands.check_any(commands.is_owner(), commands.has_permissions(administrator=True))
+async def show_stats(ctx: commands.Context):
+    """
+    !stats
+    Summarizes LLM usage, provider latency, queueing, caches and resident user state.
+    The full set of metrics is served in Prometheus format on METRICS_PORT.
+    """
+    if worker_pool is not None:
+        workers = await worker_pool.stats()
+    else:
+        workers = [{"worker": None, "llm": agent.stats(), "pages": page_fetcher.stats()}]
+    await ctx.send(format_stats(workers)[:2000])
+
+def format_stats(workers: list) -> str:
+    """Render !stats from each process's agent.stats() and page_fetcher.stats()"""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+
+    lines = ["**Bot stats**"]
+    for worker in workers:
+        if worker["worker"] is not None:
+            lines.append(f"__Worker {worker['worker']}__")
+        llm, pages = worker["llm"], worker["pages"]
+        usage = llm["usage"]
+        lines.append(
+            f"LLM: {usage['calls']} calls, {usage['prompt_tokens']} prompt / {usage['completion_tokens']} completion "
+            f"tokens, {usage['cache_hit_rate']:.0%} of prompt tokens cached"
+        )
+        for provider in llm["providers"]:
+            lines.append(
+                f"- {provider['name']}: {provider['calls']} calls, {provider['failures']} failures, first token "
+                f"p50 {seconds(provider['first_token_p50'])} / p95 {seconds(provider['first_token_p95'])}, "
+                f"circuit {'open' if provider['circuit_open'] else 'closed'}"
+            )
+        lines.append(f"Hedges: {llm['hedges']} ({llm['hedge_wins']} won), retries: {llm['retries']}")
+        for name, queue in llm["queues"].items():
+            lines.append(
+                f"Queue {name}: {queue['queued']} queued, wait p50 {queue['wait_p50']:.2f}s / p99 {queue['wait_p99']:.2f}s"
+            )
+        lines.append(
+            f"Page cache: {pages['entries']} entries, {pages['hit_rate']:.0%} hit rate, "
+            f"fetch p95 {seconds(pages['fetch_p95'])}, parse p95 {seconds(pages['parse_p95'])}"
+        )
+    if worker_pool is not None:
+        lines.append(f"Workers: {len(workers)} of {worker_pool.processes} connected, {worker_pool.restarts} restarts")
+    responses = agent.response_cache.stats()
+    lines.append(f"Response cache: {responses['entries']} entries, {responses['hit_rate']:.0%} hit rate")
+    compaction = compactor.stats()
+    lines.append(
+        f"History compaction: {compaction['runs']} summaries, {compaction['turns_folded']} turns folded, "
+        f"{compaction['cancelled']} cancelled, {compaction['failures']} failed"
     )
-
-    advice = await agent.generate_custom_response(system_prompt, user_prompt)
-    user_debate_histories[user_id].append((f"Bot's Advice", advice))
-    await ctx.send(f"**Bot's Advice:**\n{advice}")
+    speculation = speculator.stats()
+    lines.append(
+        f"Speculation: {speculation['calls']} calls, {speculation['hit_rate']:.0%} hit rate "
+        f"({speculation['hits']}/{speculation['hits'] + speculation['misses']} commands), "
+        f"{speculation['used_tokens']} tokens used, {speculation['wasted_tokens']} wasted"
+    )
+    users = user_state.stats()
+    lines.append(
+        f"Users in memory: {users['resident_users']} ({users['resident_bytes'] / 2**20:.1f} MiB), "
+        f"{users['evictions']} evictions"
+    )
+    return "\n".join(lines)
+
+async def main():
+    async with bot:
+        # Loading the tokenizer reads its encoding files; keep that off the event loop
+        tokenizer_loading = asyncio.create_task(warm_tokenizer())
+        user_state.start()
+        metrics_server = await serve_metrics()
+        if worker_pool is not None:
+            await worker_pool.start()
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            tokenizer_loading.cancel()
+            compactor.close()
+            speculator.close()
+            if worker_pool is not None:
+                await worker_pool.close()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await page_fetcher.close()
+            await store.close()
 
 if __name__ == "__main__":
-    bot.run(DISCORD_TOKEN)
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import logging
+
+from metrics import REGISTRY
+from scheduler import PRIORITY_BACKGROUND, current_generation
+from tokens import truncate_to_tokens
+
+logger = logging.getLogger("discord")
+
+# Seconds without a new turn before a user's old turns are folded into their summary
+COMPACTION_IDLE_SECONDS = float(os.getenv("COMPACTION_IDLE_SECONDS", "60"))
+# Compaction calls in flight across all users
+COMPACTION_CONCURRENCY = int(os.getenv("COMPACTION_CONCURRENCY", "1"))
+SUMMARY_TOKEN_LIMIT = int(os.getenv("SUMMARY_TOKEN_LIMIT", "300"))
+COMPACTION_BATCH_TURNS = 40  # Turns folded per call; a longer backlog takes several calls
+COMPACTION_TURN_TOKENS = 200  # Each turn is cut to this many tokens in the compaction prompt
+
+COMPACTION_INSTRUCTIONS = (
+    "You keep the running summary of a hiring debate in which companies compete to recruit a candidate.\n"
+    "Update the summary with the new turns. Keep what later arguments depend on: the candidate's preferences, "
+    "concerns and open questions, each company's main claims, promises and concessions, and how the candidate "
+    "has reacted to them. Drop pleasantries and repetition.\n"
+    f"Reply with only the updated summary, at most {SUMMARY_TOKEN_LIMIT * 3 // 4} words.\n"
+)
+
+
+def compaction_prompt(summary: str, turns: list) -> str:
+    lines = "\n".join(f"[{speaker}]: {truncate_to_tokens(text, COMPACTION_TURN_TOKENS)}" for speaker, text in turns)
+    return f"Current summary:\n{summary or 'None yet.'}\n\nNew turns:\n{lines}\n"
+
+
+class HistoryCompactor:
+    """
+    Folds debate turns that have left the prompt window into a bounded per-user
+    rolling summary, so prompts stay the same size however long a debate runs.
+    Compaction starts once a user has been idle for COMPACTION_IDLE_SECONDS and
+    runs at background priority; a new turn from the user cancels it. Summaries
+    and the number of turns they cover are kept in the Store.
+
+    `kept_turns(user_id)` is how many of the user's latest turns the prompt still
+    shows; `on_summary(user_id, summary, folded)` is called with each new summary.
+    """
+
+    def __init__(self, store, agent, kept_turns, on_summary, idle_seconds: float = COMPACTION_IDLE_SECONDS):
+        self.store = store
+        self.agent = agent
+        self.kept_turns = kept_turns
+        self.on_summary = on_summary
+        self.idle_seconds = idle_seconds
+        self.tasks = {}  # user_id -> idle timer or running compaction
+        self.slots = asyncio.Semaphore(COMPACTION_CONCURRENCY)
+        self.runs = 0
+        self.turns_folded = 0
+        self.cancelled = 0
+        self.failures = 0
+        REGISTRY.callback("history_compactions_total", "Summary updates from history compaction",
+                          lambda: self.runs, "counter")
+        REGISTRY.callback("history_compacted_turns_total", "Debate turns folded into summaries",
+                          lambda: self.turns_folded, "counter")
+        REGISTRY.callback("history_compactions_cancelled_total", "Compactions abandoned because the user came back",
+                          lambda: self.cancelled, "counter")
+
+    def schedule(self, user_id):
+        """Call on every new turn: restarts the user's idle timer and stops a compaction in progress"""
+        task = self.tasks.get(user_id)
+        if task is not None and not task.done():
+            task.cancel()
+        self.tasks[user_id] = asyncio.create_task(self.run(user_id))
+
+    async def run(self, user_id):
+        # Scheduled from inside a round, but not part of it: a newer message must not withdraw it
+        current_generation.set(None)
+        try:
+            await asyncio.sleep(self.idle_seconds)
+            async with self.slots:
+                await self.compact(user_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"History compaction for user {user_id} failed: {e}")
+        finally:
+            if self.tasks.get(user_id) is asyncio.current_task():
+                del self.tasks[user_id]
+
+    async def compact(self, user_id):
+        """Fold every turn older than the prompt window into the user's summary"""
+        summary, folded = await self.store.run(self.store.load_summary, user_id) or ("", 0)
+        while True:
+            await self.store.flush()
+            end = await self.store.count_history(user_id) - self.kept_turns(user_id)
+            if end <= folded:
+                return
+            stop = min(end, folded + COMPACTION_BATCH_TURNS)
+            turns = await self.store.load_history_range(user_id, folded, stop)
+            messages = [
+                {"role": "system", "content": COMPACTION_INSTRUCTIONS},
+                {"role": "user", "content": compaction_prompt(summary, turns)},
+            ]
+            try:
+                reply = await self.agent.queue_request(messages, user_id, PRIORITY_BACKGROUND)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            summary = truncate_to_tokens(reply.strip(), SUMMARY_TOKEN_LIMIT)
+            folded = stop
+            await self.store.save_summary(user_id, summary, folded)
+            self.runs += 1
+            self.turns_folded += len(turns)
+            logger.info(f"Compacted {len(turns)} turns for user {user_id}; summary covers {folded} turns")
+            self.on_summary(user_id, summary, folded)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "turns_folded": self.turns_folded,
+            "cancelled": self.cancelled,
+            "failures": self.failures,
+            "pending": len(self.tasks),
+        }
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
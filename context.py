@@ -0,0 +1,178 @@
+import os
+from collections import deque
+
+from tokens import count_tokens, truncate_to_tokens
+
+HISTORY_WINDOW = 20  # Debate turns kept for prompts
+# Turns dropped at once when the window overflows. Evicting in blocks rather than one
+# turn per append keeps the history prefix byte-identical for several turns, which is
+# what the provider's automatic prompt caching keys on.
+HISTORY_EVICT_STEP = 5
+# Upper bound on input tokens (system + user prompt) for every debate/advice call
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+
+# Trim stages tried in order until the context fits:
+# (job description token cap, turns kept, summary token cap).
+# Job descriptions are shortened first, then older turns are dropped and the summary cut.
+TRIM_STAGES = [
+    (None, 20, None),
+    (600, 20, None),
+    (600, 10, None),
+    (250, 10, 200),
+    (250, 4, 200),
+    (100, 4, 100),
+    (100, 1, 100),
+]
+
+
+def render_offers_section(user_offers: dict, description_cap: int = None) -> str:
+    """Format the offers block that opens every debate prompt"""
+    offers_summary_lines = ["### Current Job Offers Under Consideration ###\n"]
+    if not user_offers:
+        offers_summary_lines.append("No job offers available.\n")
+    else:
+        for oid, data in user_offers.items():
+            job_description = data['job_description']
+            if description_cap is not None:
+                job_description = truncate_to_tokens(job_description, description_cap)
+            offers_summary_lines.append(
+                f"**Offer ID:** {oid}\n"
+                f"**Company:** {data['name']}\n"
+                f"**Job Title:** {data['title']}\n"
+                f"**Location:** {data['location']}\n"
+                f"**Job Description:** {job_description}\n"
+                f"**Compensation Package:** {data['package']}\n"
+            )
+    return f"\n{'-'*40}".join(offers_summary_lines)
+
+
+class DebateContext:
+    """
+    Per-user prompt context. Offers blocks are rendered once per truncation level and
+    reused until the offers change; debate turns are formatted and token-counted as they
+    are appended and kept in a bounded buffer of at most `window` entries. Turns older
+    than the window, or dropped by trimming, are represented by the rolling summary.
+    """
+
+    def __init__(self, history=(), window: int = HISTORY_WINDOW, summary: str = None):
+        self.window = window
+        self.offers_sections = {}  # description cap -> (text, tokens)
+        self.rendered = {}  # (budget, skip_trailing) -> (text, tokens)
+        self.turns = deque()  # (formatted line, tokens)
+        self.summary = None
+        self.summary_sections = {}  # summary token cap -> (text, tokens)
+        # Fewest of the latest turns any budgeted prompt has shown since the offers changed;
+        # older turns have to be covered by the summary
+        self.fewest_shown = None
+        if summary:
+            self.set_summary(summary)
+        for speaker, text in history:
+            self.append_turn(speaker, text)
+
+    def invalidate_offers(self):
+        """Call whenever the user's offers are created, updated or removed"""
+        self.offers_sections = {}
+        self.rendered = {}
+        self.fewest_shown = None
+
+    def set_summary(self, summary: str):
+        """Replace the summary of the turns that fell out of the prompt"""
+        self.summary = summary
+        self.summary_sections = {}
+        self.rendered = {}
+
+    def summary_section(self, summary_cap: int = None):
+        if not self.summary:
+            return "", 0
+        if summary_cap not in self.summary_sections:
+            summary = self.summary if summary_cap is None else truncate_to_tokens(self.summary, summary_cap)
+            text = f"### Earlier in the Debate (summary) ###\n{summary}"
+            self.summary_sections[summary_cap] = (text, count_tokens(text))
+        return self.summary_sections[summary_cap]
+
+    def kept_turns(self) -> int:
+        """How many of the latest turns every prompt still shows"""
+        if self.fewest_shown is None:
+            return len(self.turns)
+        return min(self.fewest_shown, len(self.turns))
+
+    def append_turn(self, speaker: str, text: str):
+        line = f"[{speaker}]: {text}"
+        self.turns.append((line, count_tokens(line)))
+        if len(self.turns) > self.window:
+            for _ in range(min(HISTORY_EVICT_STEP, len(self.turns) - 1)):
+                self.turns.popleft()
+        self.rendered = {}
+
+    def offers_section(self, user_offers: dict, description_cap: int = None):
+        if description_cap not in self.offers_sections:
+            text = render_offers_section(user_offers, description_cap)
+            self.offers_sections[description_cap] = (text, count_tokens(text))
+        return self.offers_sections[description_cap]
+
+    def compose(self, offers_text: str, turns: list, summary_text: str = "") -> str:
+        debate_lines = ["### Debate History ###\n"]
+        if not turns:
+            debate_lines.append("No debate has occurred yet.")
+        else:
+            debate_lines.extend(turns)
+
+        debate_text = "\n".join(debate_lines)
+        if summary_text:
+            debate_text = f"{summary_text}\n\n{debate_text}"
+        return f"{offers_text}\n\n{'='*40}\n\n{debate_text}"
+
+    def render(self, user_offers: dict, budget: int = None, skip_trailing: str = None):
+        """
+        Constructs a structured context string that includes:
+          1) A summary of all current job offers for the user.
+          2) The debate history, including arguments from companies and user responses,
+             preceded by the summary of older turns.
+        With a token budget, job descriptions are truncated, older turns dropped and
+        the summary shortened (see TRIM_STAGES) until it fits. Turns at the end of the history by the
+        speaker `skip_trailing` are left out. Returns (context, token count).
+        """
+        cache_key = (budget, skip_trailing)
+        if cache_key in self.rendered:
+            return self.rendered[cache_key]
+
+        turns = list(self.turns)
+        if skip_trailing is not None:
+            prefix = f"[{skip_trailing}]: "
+            while turns and turns[-1][0].startswith(prefix):
+                turns.pop()
+        skipped = len(self.turns) - len(turns)
+
+        if budget is None:
+            text = self.compose(self.offers_section(user_offers)[0], [line for line, _ in turns],
+                                self.summary_section()[0])
+            self.rendered[cache_key] = (text, count_tokens(text))
+            return self.rendered[cache_key]
+
+        for description_cap, keep_turns, summary_cap in TRIM_STAGES:
+            offers_text, offers_tokens = self.offers_section(user_offers, description_cap)
+            summary_text, summary_tokens = self.summary_section(summary_cap)
+            kept = turns[-keep_turns:]
+            # Cheap estimate from cached counts before paying for an exact count
+            if offers_tokens + summary_tokens + sum(tokens for _, tokens in kept) > budget:
+                continue
+            text = self.compose(offers_text, [line for line, _ in kept], summary_text)
+            tokens = count_tokens(text)
+            if tokens <= budget:
+                self.record_shown(len(kept) + skipped)
+                self.rendered[cache_key] = (text, tokens)
+                return self.rendered[cache_key]
+
+        # Nothing fit: hard-truncate the most aggressive stage
+        description_cap, keep_turns, summary_cap = TRIM_STAGES[-1]
+        kept = turns[-keep_turns:]
+        text = self.compose(self.offers_section(user_offers, description_cap)[0], [line for line, _ in kept],
+                            self.summary_section(summary_cap)[0])
+        text = truncate_to_tokens(text, max(budget, 0))
+        self.record_shown(len(kept) + skipped)
+        self.rendered[cache_key] = (text, count_tokens(text))
+        return self.rendered[cache_key]
+
+    def record_shown(self, shown: int):
+        if self.fewest_shown is None or shown < self.fewest_shown:
+            self.fewest_shown = shown
@@ -0,0 +1,307 @@
+"""
+Structured job-posting extraction on lxml (libxml2). scraper.py imports this on the first
+parse and falls back to its html.parser paragraph scrape when lxml is not installed.
+"""
+import re
+import json
+
+import lxml.html
+from lxml import etree
+
+# Limits on the compact summary that ends up in every prompt about the offer
+MAX_ITEMS = 8
+MAX_ITEM_CHARS = 200
+MAX_SUMMARY_CHARS = 600
+
+# Page furniture that never holds the posting itself
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "nav", "header",
+                    "footer", "aside", "form", "button", "select")
+BOILERPLATE_ATTR = re.compile(
+    r"cookie|consent|banner|navbar|\bnav\b|menu|footer|header|sidebar|breadcrumb|share|social|"
+    r"related|recommend|subscribe|newsletter|modal|popup|signup|login", re.I)
+BOILERPLATE_ROLES = ("navigation", "banner", "contentinfo", "complementary", "dialog")
+BLOCK_TAGS = ("h1", "h2", "h3", "h4", "h5", "p", "li", "dt", "dd")
+
+RESPONSIBILITIES_HEADING = re.compile(
+    r"responsibilit|what you('| wi)ll do|what you will be doing|the role|your role|duties|day[- ]to[- ]day|"
+    r"you will|in this role", re.I)
+REQUIREMENTS_HEADING = re.compile(
+    r"requirement|qualification|what you('| wi)ll (need|bring)|what we('re| are) looking for|skills|"
+    r"about you|you have|experience", re.I)
+LOCATION_LINE = re.compile(r"^\s*(?:job\s+)?locations?\s*[:\-–]\s*(.{2,80}?)\s*$", re.I | re.M)
+SALARY = re.compile(
+    r"(?:[$€£¥]|\b(?:USD|EUR|GBP|CAD|AUD)\s?)\s?\d[\d,.]*\s?[kK]?"
+    r"(?:\s?(?:-|–|—|to)\s?(?:[$€£¥]|\b(?:USD|EUR|GBP|CAD|AUD)\s?)?\s?\d[\d,.]*\s?[kK]?)?"
+    r"(?:\s?(?:USD|EUR|GBP|CAD|AUD))?"
+    r"(?:\s?(?:per|/|a)\s?(?:year|yr|annum|hour|hr|month))?")
+WHITESPACE = re.compile(r"\s+")
+
+EMPTY_RESULT = "No meaningful content found."
+
+
+def clean(text) -> str:
+    return WHITESPACE.sub(" ", str(text or "")).strip()
+
+
+def clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 3].rsplit(" ", 1)[0] + "..."
+
+
+def parse_html(html: str):
+    """lxml document for html, or None if it is empty or unparseable"""
+    if not html or not html.strip():
+        return None
+    try:
+        try:
+            return lxml.html.document_fromstring(html)
+        except ValueError:
+            # Strings with an XML encoding declaration have to be parsed as bytes
+            return lxml.html.document_fromstring(html.encode("utf-8"))
+    except etree.ParserError:
+        return None
+
+
+def find_job_posting(data):
+    """The first schema.org JobPosting in a JSON-LD value (objects, lists and @graph)"""
+    if isinstance(data, list):
+        for item in data:
+            found = find_job_posting(item)
+            if found is not None:
+                return found
+    elif isinstance(data, dict):
+        types = data.get("@type")
+        if types == "JobPosting" or (isinstance(types, list) and "JobPosting" in types):
+            return data
+        if "@graph" in data:
+            return find_job_posting(data["@graph"])
+    return None
+
+
+def json_ld_posting(doc):
+    for script in doc.xpath('//script[@type="application/ld+json"]'):
+        try:
+            posting = find_job_posting(json.loads(script.text or "", strict=False))
+        except ValueError:
+            continue
+        if posting is not None:
+            return posting
+    return None
+
+
+def text_of(value) -> str:
+    """Plain text of a JSON-LD value, which may be a string of HTML, a Thing or a list"""
+    if isinstance(value, list):
+        return ", ".join(filter(None, (text_of(v) for v in value)))
+    if isinstance(value, dict):
+        return text_of(value.get("name") or value.get("value") or value.get("description"))
+    if isinstance(value, str) and "<" in value:
+        fragment = parse_html(value)
+        return clean(fragment.text_content()) if fragment is not None else clean(value)
+    return clean(value)
+
+
+def posting_location(posting: dict) -> str:
+    places = posting.get("jobLocation") or []
+    places = places if isinstance(places, list) else [places]
+    locations = []
+    for place in places:
+        address = place.get("address", place) if isinstance(place, dict) else place
+        if isinstance(address, dict):
+            parts = (address.get("addressLocality"), address.get("addressRegion"), text_of(address.get("addressCountry")))
+            location = ", ".join(clean(p) for p in parts if p)
+        else:
+            location = text_of(address)
+        if location and location not in locations:
+            locations.append(location)
+    if posting.get("jobLocationType") == "TELECOMMUTE":
+        locations.append("Remote")
+    return "; ".join(locations)
+
+
+def number(value) -> str:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return clean(value)
+    return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+
+
+def posting_salary(posting: dict) -> str:
+    salary = posting.get("baseSalary") or posting.get("estimatedSalary")
+    if isinstance(salary, list):
+        salary = salary[0] if salary else None
+    if not isinstance(salary, dict):
+        return text_of(salary)
+    currency = salary.get("currency", "")
+    value = salary.get("value", salary)
+    if not isinstance(value, dict):
+        return clean(f"{value} {currency}")
+    amounts = [number(v) for v in (value.get("minValue"), value.get("maxValue"), value.get("value")) if v is not None]
+    amount = "–".join(dict.fromkeys(amounts))  # A range, or the single value
+    unit = value.get("unitText") or salary.get("unitText")
+    unit = unit if isinstance(unit, str) else None  # Only a unit name reads as "per ..."
+    return clean(f"{amount} {currency}" + (f" per {unit.lower()}" if unit else ""))
+
+
+def meta_content(doc, *names) -> str:
+    for name in names:
+        for content in doc.xpath(f'//meta[@property="{name}" or @name="{name}"]/@content'):
+            if content.strip():
+                return clean(content)
+    return ""
+
+
+def is_boilerplate(element) -> bool:
+    if element.tag in BOILERPLATE_TAGS:
+        return True
+    if element.get("role") in BOILERPLATE_ROLES or element.get("aria-hidden") == "true":
+        return True
+    names = f"{element.get('class', '')} {element.get('id', '')}"
+    return (names != " " and element.tag not in ("main", "article") and BOILERPLATE_ATTR.search(names) is not None
+            and element.find(".//h1") is None)  # A "job-header" block holds the title, not furniture
+
+
+def strip_boilerplate(doc):
+    """Drop page furniture (navigation, cookie banners, footers, forms) in place"""
+    body = doc.find("body")
+    stack = [body if body is not None else doc]
+    while stack:
+        # Walk top down so a dropped block's descendants are never visited
+        for child in list(stack.pop()):
+            if not isinstance(child.tag, str):
+                continue  # Comments and processing instructions
+            if is_boilerplate(child):
+                child.drop_tree()
+            else:
+                stack.append(child)
+
+
+def main_content(doc):
+    """The element holding the posting: <main>/<article>, else the densest block of paragraphs"""
+    for path in ("//main", '//*[@role="main"]', "//article"):
+        found = doc.xpath(path)
+        if found and len(clean(found[0].text_content())) > 200:
+            return found[0]
+    scores = {}
+    for p in doc.iter("p", "li"):
+        parent = p.getparent()
+        if parent is None:
+            continue
+        length = len(clean(p.text_content()))
+        scores[parent] = scores.get(parent, 0) + length
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + length / 2
+    if not scores:
+        return doc.body if doc.find("body") is not None else doc
+    return max(scores, key=scores.get)
+
+
+def blocks(root) -> list:
+    """(tag, text) for each heading, paragraph and list item, in document order"""
+    found = []
+    for element in root.iter(*BLOCK_TAGS):
+        text = clean(element.text_content())
+        if text and not (found and found[-1][1] == text):
+            found.append((element.tag, text))
+    return found
+
+
+def section_items(content: list, heading: re.Pattern) -> list:
+    """List items (or paragraphs) under the first heading that matches, up to the next heading"""
+    items = []
+    inside = False
+    for tag, text in content:
+        is_heading = tag[0] == "h" or tag == "dt" or (tag == "p" and len(text) < 80 and text.endswith(":"))
+        if is_heading:
+            if inside and items:
+                break
+            inside = bool(heading.search(text))
+            continue
+        if inside:
+            items.append(text)
+    return [clip(item, MAX_ITEM_CHARS) for item in items[:MAX_ITEMS]]
+
+
+def split_items(text: str) -> list:
+    """Items of a JSON-LD list field, which is usually one string with bullets or line breaks"""
+    fragment = parse_html(text) if "<" in text else None
+    if fragment is not None:
+        items = [clean(li.text_content()) for li in fragment.iter("li")]
+        if items:
+            return items
+        text = fragment.text_content()
+    parts = re.split(r"\n|•|·|(?<=[.;])\s+(?=[A-Z])", text)
+    return [clean(part).lstrip("-* ") for part in parts if len(clean(part)) > 3]
+
+
+def extract_job_posting(html: str) -> dict:
+    """
+    Compact fields of a job posting page. Prefers schema.org JobPosting JSON-LD, then
+    meta tags, then the page's main content once boilerplate is stripped. Fields that
+    cannot be found are left out.
+    """
+    doc = parse_html(html)
+    if doc is None:
+        return {}
+    fields = {}
+    content = []  # (tag, text) blocks the sections and summary are read from
+    posting = json_ld_posting(doc)
+    if posting is not None:
+        fields["title"] = text_of(posting.get("title"))
+        fields["company"] = text_of(posting.get("hiringOrganization"))
+        fields["location"] = posting_location(posting)
+        fields["salary"] = posting_salary(posting)
+        fields["employment_type"] = text_of(posting.get("employmentType")).replace("_", " ").lower()
+        for key, source in (("responsibilities", "responsibilities"), ("requirements", "qualifications"),
+                            ("requirements", "experienceRequirements"), ("requirements", "skills")):
+            if not fields.get(key) and isinstance(posting.get(source), str):
+                fields[key] = [clip(item, MAX_ITEM_CHARS) for item in split_items(posting[source])[:MAX_ITEMS]]
+        description = posting.get("description")
+        if isinstance(description, str) and "<" in description:
+            fragment = parse_html(description)
+            content = blocks(fragment) if fragment is not None else []
+        elif isinstance(description, str):
+            fields["summary"] = clip(clean(description), MAX_SUMMARY_CHARS)
+
+    if not fields.get("title"):
+        h1 = doc.xpath("//h1")
+        fields["title"] = (meta_content(doc, "og:title", "twitter:title")
+                           or (clean(h1[0].text_content()) if h1 else clean(doc.findtext(".//title"))))
+    if not fields.get("summary"):
+        fields["summary"] = meta_content(doc, "og:description", "description", "twitter:description")
+    if not content:
+        strip_boilerplate(doc)
+        content = blocks(main_content(doc))
+
+    text = "\n".join(text for _, text in content)
+    if not fields.get("location"):
+        match = LOCATION_LINE.search(text)
+        fields["location"] = clean(match.group(1)) if match else ""
+    if not fields.get("salary"):
+        match = next((m for m in SALARY.finditer(text) if re.search(r"\d{2}", m.group())), None)
+        fields["salary"] = clean(match.group()) if match else ""
+    if not fields.get("responsibilities"):
+        fields["responsibilities"] = section_items(content, RESPONSIBILITIES_HEADING)
+    if not fields.get("requirements"):
+        fields["requirements"] = section_items(content, REQUIREMENTS_HEADING)
+    if not fields["summary"]:
+        paragraphs = [t for tag, t in content if tag == "p"]
+        fields["summary"] = " ".join([t for t in paragraphs if len(t) > 40] or paragraphs)
+    fields["summary"] = clip(fields["summary"], MAX_SUMMARY_CHARS)
+    if not fields["responsibilities"] and not fields["requirements"]:
+        # No recognizable sections: keep the leading list items of the content
+        fields["responsibilities"] = [clip(t, MAX_ITEM_CHARS) for tag, t in content if tag == "li"][:MAX_ITEMS]
+    return {key: value for key, value in fields.items() if value}
+
+
+def format_job_posting(fields: dict) -> str:
+    """Render extracted fields as the short text stored as an offer's job description"""
+    labels = (("title", "Title"), ("company", "Company"), ("location", "Location"), ("salary", "Salary"),
+              ("employment_type", "Employment type"), ("summary", "Summary"))
+    lines = [f"{label}: {fields[key]}" for key, label in labels if fields.get(key)]
+    for key, label in (("responsibilities", "Key responsibilities"), ("requirements", "Requirements")):
+        if fields.get(key):
+            lines.append(f"{label}:")
+            lines.extend(f"- {item}" for item in fields[key])
+    return "\n".join(lines) if lines else EMPTY_RESULT
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import logging
+import secrets
+import contextvars
+from bisect import bisect_left
+from collections import deque
+
+logger = logging.getLogger("discord")
+
+# Seconds; suits everything from a cache lookup to a slow completion
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# Prometheus endpoint; bound to localhost, 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# STARTUP_PROFILE=eager starts the way the bot did before lean intents and lazy imports,
+# so bench/startup.py can measure both profiles
+EAGER_STARTUP = os.getenv("STARTUP_PROFILE", "lean").lower() == "eager"
+
+
+class Histogram:
+    """Bucketed histogram, plus a window of recent samples for percentile estimates"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window: int = 500):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, p: float):
+        """p in [0, 1] over the recent window, or None without samples"""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class Registry:
+    """
+    Named metric families with labels, rendered in the Prometheus text format.
+    Histograms are updated in place; counts and sizes that already live on other
+    objects (cache stats, queue sizes) are registered as callbacks and only read at
+    scrape time, so they add nothing to the hot paths.
+    """
+
+    def __init__(self):
+        self.families = {}  # name -> [type, help, {label items: metric or callback}]
+
+    def family(self, name: str, kind: str, help_text: str) -> dict:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = [kind, help_text, {}]
+        return family[2]
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        series = self.family(name, "histogram", help_text)
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram(buckets)
+        return series[key]
+
+    def callback(self, name: str, help_text: str, read, kind: str = "gauge", **labels):
+        """Register `read()` as the value of a gauge (or counter) series"""
+        self.family(name, kind, help_text)[tuple(sorted(labels.items()))] = read
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, series) in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series.items():
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + ("+Inf",), metric.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {metric.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {metric.count}")
+                else:
+                    try:
+                        lines.append(f"{name}{format_labels(labels)} {float(metric())}")
+                    except Exception as e:
+                        logger.warning(f"Metric {name} could not be read: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+def process_start_time() -> float:
+    """When this process started (seconds since the epoch), imports included"""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # Field 22: starttime, in ticks since boot
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf("SC_CLK_TCK")
+        return time.time() - age
+    except (OSError, ValueError, AttributeError):
+        return time.time()  # No /proc: close enough, metrics is imported early
+
+
+PROCESS_STARTED = process_start_time()
+
+
+def resident_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def load_eagerly(providers=()):
+    """The eager startup profile: import every heavy dependency and create the SDK clients up front"""
+    import bs4, requests, tiktoken, validators  # noqa: F401
+
+    for provider in providers:
+        provider.client
+
+
+REGISTRY.callback("process_resident_memory_bytes", "Resident memory size", resident_bytes)
+REGISTRY.callback("process_start_time_seconds", "Start time of the process since the epoch", lambda: PROCESS_STARTED)
+
+# Span currently active in this task (copied into tasks it creates)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed unit of work within a trace. A trace starts at a Discord interaction and
+    every span started while it is active (in this task or tasks it creates, or in
+    an LLM worker serving its requests) shares its trace id.
+    """
+
+    __slots__ = ("name", "trace_id", "parent", "attributes", "started", "token")
+
+    def __init__(self, name: str, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(6)
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.token = None
+
+    @classmethod
+    def start(cls, name: str, **attributes):
+        """Start a child of the active span (or a new trace) and make it the active one"""
+        span = cls(name, current_span.get(), **attributes)
+        span.token = current_span.set(span)
+        return span
+
+    def end(self):
+        duration = time.perf_counter() - self.started
+        if self.token is not None:
+            try:
+                current_span.reset(self.token)
+            except ValueError:
+                pass  # Ended from a different context than it started in
+            self.token = None
+        REGISTRY.histogram("span_duration_seconds", "Duration of traced operations", span=self.name).observe(duration)
+        if logger.isEnabledFor(logging.DEBUG):
+            attributes = " ".join(f"{k}={v}" for k, v in self.attributes.items())
+            logger.debug(f"[trace {self.trace_id}] {self.name} {duration * 1000:.1f}ms {attributes}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+
+
+def span(name: str, **attributes) -> Span:
+    """`with span("fetch", url=...):` times a block as a child of the active span"""
+    return Span.start(name, **attributes)
+
+
+def trace_id() -> str:
+    active = current_span.get()
+    return active.trace_id if active is not None else "-"
+
+
+async def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Expose REGISTRY at http://host:port/metrics; returns the runner to clean up, or None"""
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,372 @@
+import os
+import time
+import asyncio
+import logging
+
+from metrics import REGISTRY
+from ratelimit import (
+    LLM_MAX_IN_FLIGHT, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES, EXPECTED_COMPLETION_TOKENS,
+    CircuitBreaker, CircuitOpenError, NoHeadroomError, RateLimiter,
+    backoff_delay, estimate_tokens, parse_duration, parse_retry_after,
+)
+
+logger = logging.getLogger("discord")
+
+GPT_MODEL = "gpt-4o-2024-11-20"
+MISTRAL_MODEL = "mistral-large-latest"
+
+# Comma-separated backends in priority order; LLM_PROVIDERS="openai,mistral" enables hedging
+DEFAULT_PROVIDERS = "openai"
+# Fire the next provider when the primary has no first token after this percentile of its latency
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = 20  # Below this, use the default delay and the configured order
+HEDGE_DEFAULT_DELAY = 3.0
+HEDGE_MIN_DELAY = 0.3
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Provider:
+    """
+    One LLM backend with its own rate budget, in-flight limit, circuit breaker and
+    latency histograms. Subclasses implement stream(), an async iterator of
+    (text delta, usage) events where usage is None except on the event that reports it.
+    """
+
+    name = "provider"
+
+    def __init__(self, model: str, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.model = model
+        self._client = None
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.breaker = CircuitBreaker(self.name)
+        self.first_token_latency = REGISTRY.histogram(
+            "llm_first_token_seconds", "Time from sending a request to its first content", provider=self.name)
+        self.total_latency = REGISTRY.histogram(
+            "llm_request_seconds", "LLM request duration, rate-limit waits included", provider=self.name)
+        self.calls = 0
+        self.failures = 0
+        REGISTRY.callback("llm_calls_total", "Completed LLM calls", lambda: self.calls, "counter", provider=self.name)
+        REGISTRY.callback("llm_failures_total", "Failed LLM call attempts", lambda: self.failures, "counter",
+                          provider=self.name)
+        REGISTRY.callback("llm_circuit_open", "1 while the provider's circuit breaker is open",
+                          lambda: self.breaker.opened_at is not None, provider=self.name)
+
+    @property
+    def client(self):
+        """The SDK client, created on first use so its (heavy) import stays off the startup path"""
+        if self._client is None:
+            self._client = self.make_client()
+        return self._client
+
+    def make_client(self):
+        raise NotImplementedError
+
+    def stream(self, messages: list):
+        raise NotImplementedError
+
+    def retryable(self, error: Exception) -> bool:
+        return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+    def retry_after(self, error: Exception):
+        """Back-off the provider asked for in the failed response, in seconds"""
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        return parse_retry_after(getattr(response, "headers", None))
+
+    def hedge_delay(self) -> float:
+        if self.first_token_latency.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.first_token_latency.percentile(HEDGE_PERCENTILE))
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self, model: str = GPT_MODEL, **limits):
+        super().__init__(model, **limits)
+
+    def make_client(self):
+        import openai
+
+        # Retries go through the shared limiter and breaker, not the SDK's own loop
+        return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+    def retryable(self, error: Exception) -> bool:
+        import openai  # Already loaded: the error came from the client
+
+        return isinstance(error, openai.APIConnectionError) or super().retryable(error)
+
+    def observe_headers(self, headers):
+        def number(name):
+            value = headers.get(name)
+            return int(value) if value and value.isdigit() else None
+
+        self.rate_limiter.update_from_server(
+            limit_requests=number("x-ratelimit-limit-requests"),
+            limit_tokens=number("x-ratelimit-limit-tokens"),
+            remaining_requests=number("x-ratelimit-remaining-requests"),
+            remaining_tokens=number("x-ratelimit-remaining-tokens"),
+            reset_requests=parse_duration(headers.get("x-ratelimit-reset-requests")),
+            reset_tokens=parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    async def stream(self, messages: list):
+        response = await self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        self.observe_headers(response.headers)
+        stream = response.parse()
+        try:
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                yield text or "", chunk.usage
+        finally:
+            await stream.close()
+
+
+class MistralProvider(Provider):
+    name = "mistral"
+
+    def __init__(self, model: str = MISTRAL_MODEL, **limits):
+        super().__init__(model, **limits)
+
+    def make_client(self):
+        from mistralai import Mistral  # Only needed when this backend is configured
+
+        return Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+
+    async def stream(self, messages: list):
+        response = await self.client.chat.stream_async(model=self.model, messages=messages)
+        # Leaving the block closes the HTTP stream, also when a lost hedge or a superseded reply is cancelled
+        async with response as events:
+            async for event in events:
+                chunk = event.data
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                yield text if isinstance(text, str) else "", chunk.usage
+
+
+PROVIDER_TYPES = {
+    OpenAIProvider.name: OpenAIProvider,
+    MistralProvider.name: MistralProvider,
+}
+
+
+def build_providers(names: str = None, **limits) -> list:
+    """Instantiate the configured backends, in priority order"""
+    return [PROVIDER_TYPES[name](**limits) for name in provider_names(names)]
+
+
+def provider_names(names: str = None) -> list:
+    """Configured backend names (LLM_PROVIDERS), in priority order"""
+    names = names or os.getenv("LLM_PROVIDERS", DEFAULT_PROVIDERS)
+    return [name.strip() for name in names.split(",") if name.strip()]
+
+
+class Attempt:
+    """One provider's try at a request, read ahead up to its first content"""
+
+    def __init__(self, provider: Provider, messages: list, reservation: list):
+        self.provider = provider
+        self.reservation = reservation
+        self.prompt_tokens = max(0, estimate_tokens(messages) - EXPECTED_COMPLETION_TOKENS)
+        self.stream = provider.stream(messages)
+        self.started = time.monotonic()
+        self.first_token = None
+        self.buffered = []  # Events read while waiting for the first content
+        self.holding_slot = False
+        self.task = asyncio.create_task(self.prime())
+
+    async def prime(self):
+        await self.provider.in_flight.acquire()
+        self.holding_slot = True
+        breaker = self.provider.breaker
+        breaker.started()
+        try:
+            async for text, usage in self.stream:
+                self.buffered.append((text, usage))
+                if text:
+                    break
+        except asyncio.CancelledError:
+            breaker.abandoned()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        self.first_token = time.monotonic() - self.started
+        self.provider.first_token_latency.observe(self.first_token)
+
+    async def events(self):
+        """Every (text, usage) event: the buffered ones, then the rest of the stream"""
+        for event in self.buffered:
+            yield event
+        self.buffered = []
+        async for event in self.stream:
+            yield event
+
+    async def close(self):
+        if not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except BaseException:
+                pass
+        await self.stream.aclose()
+        if self.holding_slot:
+            self.holding_slot = False
+            self.provider.in_flight.release()
+
+    async def abandon(self):
+        """Close an attempt whose reply will not be used and give back the budget it did not use"""
+        failed = self.task.done() and not self.task.cancelled() and self.task.exception() is not None
+        sent = self.holding_slot and not failed
+        await self.close()
+        if sent:
+            # The prompt reached the provider; only the expected completion goes unused
+            self.provider.rate_limiter.settle(self.reservation, self.prompt_tokens)
+        else:
+            self.provider.rate_limiter.release(self.reservation)
+
+
+class ProviderRouter:
+    """
+    Routes requests across providers. The primary is the provider with the lowest
+    median time to first token (configured order until every provider has enough
+    samples). If the primary has not produced a first token within its hedge delay
+    (HEDGE_PERCENTILE of its own history) the next provider is started as well, if it
+    has spare budget; whichever yields content first wins and the other is cancelled.
+    A provider that fails outright is failed over to immediately. Providers whose
+    circuit is open are skipped, and a request that failed everywhere with a
+    retryable error is retried with jittered exponential backoff.
+    """
+
+    def __init__(self, providers: list):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        REGISTRY.callback("llm_hedges_total", "Requests hedged onto a second provider", lambda: self.hedges, "counter")
+        REGISTRY.callback("llm_hedge_wins_total", "Hedged requests won by the hedge", lambda: self.hedge_wins, "counter")
+        REGISTRY.callback("llm_retries_total", "Request retries after retryable failures", lambda: self.retries, "counter")
+
+    def ranked(self) -> list:
+        available = [p for p in self.providers if p.breaker.available()]
+        if not available:
+            retry_in = min(p.breaker.retry_in() for p in self.providers)
+            raise CircuitOpenError(f"No LLM provider available; retrying in {max(retry_in, 0):.0f}s")
+        if all(p.first_token_latency.count >= HEDGE_MIN_SAMPLES for p in available):
+            return sorted(available, key=lambda p: p.first_token_latency.percentile(0.5))
+        return available
+
+    async def open(self, messages: list, future: asyncio.Future, headroom: float = 0.0):
+        """
+        Start a request and return the winning Attempt, already holding its first
+        content, or None if `future` was cancelled before anything was sent. With
+        `headroom`, the request never waits for budget: it only goes to a provider that
+        keeps that share of its budget free, and raises NoHeadroomError if none does.
+        """
+        tokens = estimate_tokens(messages)
+        retry = 0
+        while True:
+            failures = []  # (provider, error) per failed attempt
+            try:
+                return await self.race(messages, future, tokens, failures, headroom)
+            except Exception as e:
+                if retry >= LLM_MAX_RETRIES or not failures:
+                    raise
+                provider, error = failures[-1]
+                if e is not error or not provider.retryable(error):
+                    raise
+                delay = backoff_delay(retry, provider.retry_after(error))
+                retry += 1
+                self.retries += 1
+                logger.warning(f"Retrying LLM request in {delay:.2f}s (attempt {retry + 1}): {error}")
+                await asyncio.sleep(delay)
+                if future.done():
+                    return None
+
+    async def race(self, messages: list, future: asyncio.Future, tokens: int, failures: list,
+                   headroom: float = 0.0):
+        """One routing pass: primary, hedges and failovers; records failed attempts in `failures`"""
+        candidates = self.ranked()
+        if headroom:
+            for primary in candidates:
+                reservation = primary.rate_limiter.try_acquire(tokens, headroom)
+                if reservation is not None:
+                    break
+            else:
+                raise NoHeadroomError(f"No provider has {headroom:.0%} of its budget to spare")
+            candidates.remove(primary)
+        else:
+            primary = candidates.pop(0)
+            reservation = await primary.rate_limiter.acquire(tokens)
+        if future.done():
+            # Cancelled while waiting for budget: hand the slot back unused
+            primary.rate_limiter.release(reservation)
+            return None
+
+        attempts = [Attempt(primary, messages, reservation)]
+        deadline = time.monotonic() + primary.hedge_delay()
+        error = None
+        try:
+            while attempts or candidates:
+                if attempts:
+                    timeout = max(0.0, deadline - time.monotonic()) if candidates else None
+                    done, _ = await asyncio.wait({a.task for a in attempts}, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    for attempt in [a for a in attempts if a.task in done]:
+                        attempts.remove(attempt)
+                        if attempt.task.exception() is None:
+                            for loser in attempts:
+                                await loser.abandon()
+                            attempts = []
+                            if attempt.provider is not primary:
+                                self.hedge_wins += 1
+                            return attempt
+                        error = attempt.task.exception()
+                        attempt.provider.failures += 1
+                        failures.append((attempt.provider, error))
+                        retry_after = attempt.provider.retry_after(error)
+                        if retry_after:
+                            # Hold back every request to this provider, not just this one
+                            attempt.provider.rate_limiter.pause(retry_after)
+                        logger.warning(f"{attempt.provider.name} failed: {error}")
+                        await attempt.abandon()
+                    if future.done():
+                        return None
+                    if done and attempts:
+                        continue
+
+                if not candidates:
+                    break
+                backup = candidates.pop(0)
+                if attempts:
+                    # Hedge only with budget that is free right now
+                    reservation = backup.rate_limiter.try_acquire(tokens, headroom)
+                    if reservation is None:
+                        # No spare budget yet: keep waiting on the attempts and try again shortly
+                        candidates.insert(0, backup)
+                        deadline = time.monotonic() + HEDGE_MIN_DELAY
+                        continue
+                    self.hedges += 1
+                    logger.info(f"Hedging request to {backup.name} after {primary.hedge_delay():.2f}s")
+                elif headroom:
+                    reservation = backup.rate_limiter.try_acquire(tokens, headroom)
+                    if reservation is None:
+                        continue  # Fail over only to a provider with budget to spare
+                else:
+                    reservation = await backup.rate_limiter.acquire(tokens)
+                attempts.append(Attempt(backup, messages, reservation))
+                deadline = time.monotonic() + backup.hedge_delay()
+            raise error
+        finally:
+            for attempt in attempts:
+                await attempt.abandon()
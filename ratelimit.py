@@ -0,0 +1,271 @@
+import os
+import re
+import asyncio
+import random
+import time
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger("discord")
+
+# Dispatcher limits shared by the LLM agents, overridable from the environment
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+
+# Rough completion allowance used when reserving tokens before a call
+EXPECTED_COMPLETION_TOKENS = 300
+
+# Retries of a request that failed before producing any content (429, 5xx, network)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+# Share of each rate-limit budget that background requests (compaction, speculation) leave free
+LLM_BACKGROUND_HEADROOM = float(os.getenv("LLM_BACKGROUND_HEADROOM", "0.25"))
+BACKGROUND_RETRY_DELAY = 1.0  # Seconds before a background request that found no headroom is tried again
+
+
+def estimate_tokens(messages) -> int:
+    """Cheap token estimate for a chat request (~4 characters per token)"""
+    chars = sum(len(m["content"]) for m in messages)
+    return chars // 4 + EXPECTED_COMPLETION_TOKENS
+
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset header such as "1s", "6m0s" or "20ms"; None if absent"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"([0-9.]+)(ms|h|m|s)", value)
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+
+def parse_retry_after(headers):
+    """Seconds requested by Retry-After (or retry-after-ms) response headers; None if absent"""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(retry: int, retry_after=None) -> float:
+    """Jittered exponential backoff for retry n (0-based), never shorter than Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** retry))
+    return max(delay, retry_after or 0.0)
+
+
+class CircuitOpenError(Exception):
+    """Every provider's circuit is open; requests fail fast until one is probed again"""
+
+
+class NoHeadroomError(Exception):
+    """No provider has enough spare budget for a background request right now"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout` has
+    passed, a single probe request is let through: success closes the circuit, failure
+    keeps it open for another timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0  # Consecutive
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    def available(self) -> bool:
+        if self.opened_at is None:
+            return True
+        return not self.probing and self.retry_in() <= 0
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return self.opened_at + self.reset_timeout - time.monotonic()
+
+    def started(self):
+        if self.opened_at is not None:
+            self.probing = True
+
+    def abandoned(self):
+        """A request (or probe) ended without an outcome, e.g. it lost a hedge race"""
+        self.probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.trips += 1
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over request and token budgets. When the provider
+    reports its own view of the quota (rate-limit headers) the window adopts its
+    limits and also waits out any budget the provider says is used up, e.g. by
+    other clients of the same key. pause() holds every request back, for Retry-After.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, share: float = 1.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Fraction of the key's quota this limiter may use, when processes split one key
+        self.share = share
+        self.window = 60.0
+        self.reservations = deque()  # [timestamp, tokens] per request in the window
+        self.tokens_in_window = 0
+        self.lock = asyncio.Lock()
+        self.paused_until = 0.0
+        # [remaining, resets_at] from the provider's latest rate-limit headers
+        self.server_requests = None
+        self.server_tokens = None
+
+    def _expire(self, now: float):
+        while self.reservations and now - self.reservations[0][0] >= self.window:
+            self.tokens_in_window -= self.reservations.popleft()[1]
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = max(0.0, self.paused_until - now)
+        if len(self.reservations) >= self.requests_per_minute:
+            wait = max(wait, self.reservations[0][0] + self.window - now)
+        # A single request larger than the whole budget only waits for an empty window
+        tokens = min(tokens, self.tokens_per_minute)
+        if self.tokens_in_window + tokens > self.tokens_per_minute:
+            excess = self.tokens_in_window + tokens - self.tokens_per_minute
+            for ts, used in self.reservations:
+                excess -= used
+                if excess <= 0:
+                    wait = max(wait, ts + self.window - now)
+                    break
+        for view, cost in ((self.server_requests, 1), (self.server_tokens, tokens)):
+            if view is not None and now < view[1] and view[0] < cost:
+                wait = max(wait, view[1] - now)
+        return wait
+
+    async def acquire(self, tokens: int) -> list:
+        """Wait until both budgets allow a request, then reserve it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            return self._reserve(now, tokens)
+
+    def try_acquire(self, tokens: int, headroom: float = 0.0):
+        """
+        Reserve only if both budgets allow it right now, still leaving `headroom` of
+        each free, and nobody is queued; else None
+        """
+        if self.lock.locked():
+            return None
+        now = time.monotonic()
+        self._expire(now)
+        if self._wait_time(now, tokens) > 0 or (headroom and self._headroom(now, tokens) < headroom):
+            return None
+        return self._reserve(now, tokens)
+
+    def headroom(self, tokens: int = 0) -> float:
+        """Fraction of the tighter budget that would still be free after a request of `tokens`"""
+        now = time.monotonic()
+        self._expire(now)
+        return self._headroom(now, tokens)
+
+    def _headroom(self, now: float, tokens: int) -> float:
+        free = min(1 - (len(self.reservations) + 1) / self.requests_per_minute,
+                   1 - (self.tokens_in_window + tokens) / self.tokens_per_minute)
+        for view, cost, limit in ((self.server_requests, 1, self.requests_per_minute),
+                                  (self.server_tokens, tokens, self.tokens_per_minute)):
+            if view is not None and now < view[1]:
+                # The provider's remaining budget is for the whole key, not just our share of it
+                free = min(free, (view[0] - cost) * self.share / limit)
+        return free
+
+    def _reserve(self, now: float, tokens: int) -> list:
+        reservation = [now, tokens]
+        self.reservations.append(reservation)
+        self.tokens_in_window += tokens
+        for view, cost in ((self.server_requests, 1), (self.server_tokens, tokens)):
+            if view is not None:
+                view[0] -= cost
+        return reservation
+
+    def pause(self, seconds: float):
+        """Send nothing for `seconds` (the provider asked us to back off)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_server(self, limit_requests=None, limit_tokens=None,
+                           remaining_requests=None, remaining_tokens=None,
+                           reset_requests=None, reset_tokens=None):
+        """Adopt the quota the provider reported; reset_* are seconds until it refills"""
+        now = time.monotonic()
+        if limit_requests:
+            self.requests_per_minute = max(1, int(limit_requests * self.share))
+        if limit_tokens:
+            self.tokens_per_minute = max(1, int(limit_tokens * self.share))
+        if remaining_requests is not None and reset_requests is not None:
+            self.server_requests = [remaining_requests, now + reset_requests]
+        if remaining_tokens is not None and reset_tokens is not None:
+            self.server_tokens = [remaining_tokens, now + reset_tokens]
+
+    def _index(self, reservation: list):
+        for i, r in enumerate(self.reservations):
+            if r is reservation:
+                return i
+        return None
+
+    def settle(self, reservation: list, actual_tokens: int):
+        """Replace a reservation's estimate with the tokens the provider actually billed"""
+        if self._index(reservation) is not None:
+            self.tokens_in_window += actual_tokens - reservation[1]
+        reservation[1] = actual_tokens
+
+    def release(self, reservation: list):
+        """Give back a reservation for a request that was never sent"""
+        i = self._index(reservation)
+        if i is not None:
+            del self.reservations[i]
+            self.tokens_in_window -= reservation[1]
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(30 * 60)))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of completions keyed by a hash of (model, messages), with a
+    TTL and LRU eviction by size. Entries can carry a tag (the user id) so everything
+    derived from a user's state can be dropped at once. Identical requests that arrive
+    while one is in flight wait on that call instead of making their own (single-flight).
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (text, expires_at, tag)
+        self.keys_by_tag = {}  # tag -> set of keys
+        self.in_flight = {}  # key -> Future shared by identical requests
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(model: str, messages: list) -> str:
+        payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def entry_size(key: str, text: str) -> int:
+        return len(key) + len(text)
+
+    def lookup(self, key: str):
+        """Cached text for key, or None if absent or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        text, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    async def shared_result(self, key: str):
+        """
+        Cached or in-flight result for key. Returns None when the caller has to make
+        the call itself (and should bracket it with begin/complete/fail).
+        """
+        while True:
+            text = self.lookup(key)
+            if text is not None:
+                return text
+            pending = self.in_flight.get(key)
+            if pending is None:
+                return None
+            self.shared += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller that owned the request gave up; try again, possibly as owner
+
+    def begin(self, key: str):
+        self.misses += 1
+        self.in_flight[key] = asyncio.get_running_loop().create_future()
+
+    def complete(self, key: str, text: str, tag=None):
+        future = self.in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(text)
+        self.store(key, text, tag)
+
+    def fail(self, key: str, error: BaseException):
+        future = self.in_flight.pop(key, None)
+        if future is None or future.done():
+            return
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            future.cancel()
+        else:
+            future.set_exception(error)
+            future.exception()  # Nobody may be waiting; don't log it as unretrieved
+
+    def store(self, key: str, text: str, tag=None):
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (text, time.monotonic() + self.ttl, tag)
+        self.size += self.entry_size(key, text)
+        if tag is not None:
+            self.keys_by_tag.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes and self.entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: str):
+        text, _, tag = self.entries.pop(key)
+        self.size -= self.entry_size(key, text)
+        if tag is not None:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+    def discard(self, key: str):
+        """Drop one entry, e.g. a reply that turned out to be unusable"""
+        if key in self.entries:
+            self.remove(key)
+
+    def invalidate(self, tag):
+        """Drop every entry derived from the state identified by tag"""
+        for key in list(self.keys_by_tag.get(tag, ())):
+            self.remove(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_in_flight": self.shared,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import deque
+
+from metrics import REGISTRY, current_span
+from ratelimit import estimate_tokens
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0  # Replies to a message the user just sent, !advise
+PRIORITY_BULK = 1  # !go rounds
+PRIORITY_BACKGROUND = 2  # Housekeeping such as history compaction; never promoted
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk", PRIORITY_BACKGROUND: "background"}
+
+# Estimated tokens a user may dispatch per round-robin turn within a class
+SCHEDULER_QUANTUM = int(os.getenv("SCHEDULER_QUANTUM", "500"))
+# A lower class whose oldest request has waited this long is served next anyway
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "15"))
+
+# The reply generation (e.g. one debate round) requests are queued for; a newer one
+# can withdraw a superseded generation's requests without touching the user's others
+current_generation = contextvars.ContextVar("current_generation", default=None)
+
+
+class LLMRequest:
+    """One queued completion: its messages, the future for the result and who asked"""
+
+    def __init__(self, messages: list, future: asyncio.Future, deltas: asyncio.Queue = None, user_id=None,
+                 priority: int = PRIORITY_INTERACTIVE):
+        self.messages = messages
+        self.future = future
+        self.deltas = deltas  # Set for streaming requests
+        self.user_id = user_id
+        self.priority = priority
+        self.cost = estimate_tokens(messages)
+        self.enqueued_at = time.monotonic()
+        self.span = current_span.get()  # Trace of the interaction that asked for it
+        self.generation = current_generation.get()
+
+
+class FairQueue:
+    """
+    Deficit round robin over per-user FIFOs. At the start of each turn a user's
+    deficit grows by the quantum and they dispatch requests while it covers the
+    requests' estimated tokens, so a user with ten queued calls cannot hold back
+    one with a single call.
+    """
+
+    def __init__(self, quantum: int = SCHEDULER_QUANTUM):
+        self.quantum = quantum
+        self.queues = {}  # user_id -> deque of LLMRequest
+        self.active = deque()  # user_ids with queued requests, in round-robin order
+        self.deficit = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def put(self, request: LLMRequest):
+        queue = self.queues.get(request.user_id)
+        if queue is None:
+            queue = self.queues[request.user_id] = deque()
+            # A user arriving at an idle queue starts their turn straight away
+            self.deficit[request.user_id] = 0 if self.active else self.quantum
+            self.active.append(request.user_id)
+        queue.append(request)
+        self.size += 1
+
+    def oldest(self) -> float:
+        return min(self.queues[user_id][0].enqueued_at for user_id in self.active)
+
+    def pop(self) -> LLMRequest:
+        while True:
+            user_id = self.active[0]
+            queue = self.queues[user_id]
+            if self.deficit[user_id] >= queue[0].cost:
+                request = queue.popleft()
+                self.deficit[user_id] -= request.cost
+                self.size -= 1
+                if not queue:
+                    self.drop(user_id)
+                return request
+            # Turn over: the next user starts theirs with a fresh quantum
+            self.active.rotate(-1)
+            self.deficit[self.active[0]] += self.quantum
+
+    def drop(self, user_id) -> list:
+        queue = self.queues.pop(user_id, None)
+        if queue is None:
+            return []
+        had_turn = self.active[0] == user_id
+        self.active.remove(user_id)
+        del self.deficit[user_id]
+        if had_turn and self.active:
+            self.deficit[self.active[0]] += self.quantum
+        self.size -= len(queue)
+        return list(queue)
+
+    def remove(self, user_id, generation) -> list:
+        """Withdraw the user's requests queued for `generation`, keeping the rest in order"""
+        queue = self.queues.get(user_id)
+        if queue is None:
+            return []
+        removed = [request for request in queue if request.generation is generation]
+        if len(removed) == len(queue):
+            return self.drop(user_id)
+        if removed:
+            self.queues[user_id] = deque(request for request in queue if request.generation is not generation)
+            self.size -= len(removed)
+        return removed
+
+
+class FairScheduler:
+    """
+    Pending LLM requests, fair across users within each priority class. Higher
+    classes are served first; a lower class whose oldest request has waited
+    SCHEDULER_MAX_WAIT seconds goes next so bulk work is never starved, except
+    background requests, which only run when nothing else is queued. Entries can be
+    withdrawn before a worker takes them. Queue wait is recorded per class.
+    """
+
+    def __init__(self):
+        self.classes = {priority: FairQueue() for priority in PRIORITY_NAMES}
+        self.ready = asyncio.Event()
+        self.wait_times = {
+            priority: REGISTRY.histogram("llm_queue_wait_seconds", "Time requests wait for a worker", priority=name)
+            for priority, name in PRIORITY_NAMES.items()
+        }
+        for priority, name in PRIORITY_NAMES.items():
+            REGISTRY.callback("llm_queue_depth", "Queued LLM requests", self.classes[priority].__len__, priority=name)
+
+    def put(self, request: LLMRequest):
+        self.classes[request.priority].put(request)
+        self.ready.set()
+
+    async def get(self) -> LLMRequest:
+        while self.empty():
+            self.ready.clear()
+            await self.ready.wait()
+        request = self.next_queue().pop()
+        self.wait_times[request.priority].observe(time.monotonic() - request.enqueued_at)
+        return request
+
+    def next_queue(self) -> FairQueue:
+        pending = [(priority, queue) for priority, queue in sorted(self.classes.items()) if queue.size]
+        now = time.monotonic()
+        for priority, queue in pending[1:]:
+            if priority != PRIORITY_BACKGROUND and now - queue.oldest() >= SCHEDULER_MAX_WAIT:
+                return queue
+        return pending[0][1]
+
+    def remove_generation(self, user_id, generation) -> list:
+        """Withdraw user_id's queued requests of one generation; returns the withdrawn requests"""
+        removed = []
+        for queue in self.classes.values():
+            removed.extend(queue.remove(user_id, generation))
+        return removed
+
+    def qsize(self) -> int:
+        return sum(queue.size for queue in self.classes.values())
+
+    def empty(self) -> bool:
+        return not self.qsize()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "queued": self.classes[priority].size,
+                "waited": self.wait_times[priority].count,
+                "wait_p50": self.wait_times[priority].percentile(0.5) or 0.0,
+                "wait_p99": self.wait_times[priority].percentile(0.99) or 0.0,
+            }
+            for priority, name in PRIORITY_NAMES.items()
+        }
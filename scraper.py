@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("discord")
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+FETCH_TIMEOUT = 10  # Seconds for the whole request, including the body
+MAX_BODY_BYTES = int(os.getenv("SCRAPER_MAX_BODY_BYTES", str(2 * 1024 * 1024)))
+MAX_CONNECTIONS = int(os.getenv("SCRAPER_MAX_CONNECTIONS", "32"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("SCRAPER_MAX_CONNECTIONS_PER_HOST", "4"))
+# 0 parses in a thread pool; N > 0 parses in N worker processes (true parallelism for the extractor)
+PARSE_PROCESSES = int(os.getenv("SCRAPER_PARSE_PROCESSES", "0"))
+CACHE_TTL = float(os.getenv("SCRAPER_CACHE_TTL", str(6 * 60 * 60)))
+CACHE_MAX_ENTRIES = int(os.getenv("SCRAPER_CACHE_MAX_ENTRIES", "512"))
+CACHE_PATH = os.getenv("SCRAPER_CACHE_PATH")  # Unset keeps the cache in memory only
+
+TRACKING_PARAMS = {"gclid", "fbclid", "mc_cid", "mc_eid"}
+
+
+def extract_job_text(html: str) -> str:
+    """Compact structured summary of a job posting page (see extract.py)"""
+    try:
+        from extract import extract_job_posting, format_job_posting
+    except ImportError:  # lxml is optional
+        return extract_paragraphs(html)
+    return format_job_posting(extract_job_posting(html))
+
+
+def extract_paragraphs(html: str) -> str:
+    """Pull the paragraph text out of a job posting page; the fallback without lxml"""
+    from bs4 import BeautifulSoup  # Imported on first parse (in the parse worker), not at startup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = [p.get_text() for p in soup.find_all('p')]
+    extracted_text = "\n".join(paragraphs)
+    return extracted_text if extracted_text else "No meaningful content found."
+
+
+def fetch_website_info(url: str) -> str:
+    """Blocking fetch, for scripts. The bot uses PageFetcher instead."""
+    import requests
+
+    try:
+        response = requests.get(url, headers=HEADERS, timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        html = response.text
+    except requests.exceptions.RequestException as e:
+        return f"Error fetching website: {e}"
+
+    try:
+        return extract_job_text(html)
+    except Exception as e:
+        logger.warning(f"Could not parse {url}: {e}")
+        return f"Error parsing website: {e}"
+
+
+def normalize_url(url: str) -> str:
+    """Canonical cache key: lowercase scheme and host, sorted query, and no fragment, default port or tracking params"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not (k.lower().startswith("utm_") or k.lower() in TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+class PageCache:
+    """Bounded LRU cache of extracted job text with a TTL and validators for revalidation"""
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES, path: str = CACHE_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()  # key -> {"text", "etag", "last_modified", "fetched_at"}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        if path:
+            self.load()
+
+    def get(self, key: str):
+        """Return the entry (fresh or stale) and mark it recently used, or None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def put(self, key: str, text: str, etag: str = None, last_modified: str = None):
+        self.entries[key] = {
+            "text": text,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def touch(self, key: str):
+        """Restart the TTL of an entry the server confirmed is unchanged"""
+        self.entries[key]["fetched_at"] = time.time()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in data[-self.max_entries:]:
+            self.entries[key] = entry
+
+    def snapshot(self) -> list:
+        return list(self.entries.items())
+
+    def save(self, data: list):
+        """Write a snapshot to disk atomically (call from a thread; it does file I/O)"""
+        # A tmp file of its own, so writers in other threads or processes never move it away
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".",
+                                        prefix=f"{os.path.basename(self.path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PageFetcher:
+    """Async job-page fetcher with a pooled keep-alive HTTP client and off-loop parsing"""
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS,
+                 max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                 max_body_bytes: int = MAX_BODY_BYTES, parse_processes: int = PARSE_PROCESSES,
+                 cache: PageCache = None):
+        self.cache = cache if cache is not None else PageCache()
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.max_body_bytes = max_body_bytes
+        self.session = None
+        self.fetch_seconds = REGISTRY.histogram("page_fetch_seconds", "Job page download time")
+        self.parse_seconds = REGISTRY.histogram("page_parse_seconds", "Job page parse time, executor wait included")
+        REGISTRY.callback("page_cache_hits_total", "Job pages served from the page cache",
+                          lambda: self.cache.hits, "counter")
+        REGISTRY.callback("page_cache_misses_total", "Job pages downloaded and parsed",
+                          lambda: self.cache.misses, "counter")
+        REGISTRY.callback("page_cache_entries", "Job pages in the page cache", lambda: len(self.cache.entries))
+        if parse_processes > 0:
+            self.parse_pool = ProcessPoolExecutor(max_workers=parse_processes)
+        else:
+            self.parse_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="html-parse")
+        # One thread writes the cache file, so snapshots land in the order they were taken
+        self.save_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-cache-save")
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Create the shared session lazily, inside the running event loop"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=30,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+            )
+        return self.session
+
+    async def read_body(self, response: aiohttp.ClientResponse) -> str:
+        """Stream the body, stopping once max_body_bytes have been read"""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_body_bytes:
+                logger.info(f"Truncated {response.url} at {self.max_body_bytes} bytes")
+                break
+        body = b"".join(chunks)[:self.max_body_bytes]
+        try:
+            return body.decode(response.charset or "utf-8", errors="replace")
+        except LookupError:  # Charset Python doesn't know
+            return body.decode("utf-8", errors="replace")
+
+    async def fetch_html(self, url: str, headers: dict = None):
+        """GET a page; returns (status, html, response headers). html is None on 304."""
+        async with self.get_session().get(url, headers=headers) as response:
+            if response.status == 304:
+                return response.status, None, response.headers
+            response.raise_for_status()
+            return response.status, await self.read_body(response), response.headers
+
+    async def parse(self, html: str) -> str:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.parse_pool, extract_job_text, html)
+        finally:
+            self.parse_seconds.observe(time.perf_counter() - started)
+
+    async def fetch_website_info(self, url: str) -> str:
+        """Same contract as fetch_website_info, without blocking the event loop"""
+        key = normalize_url(url)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.hits += 1
+            logger.info(f"Page cache hit for {key} ({self.cache.stats()['hit_rate']:.0%} hit rate)")
+            return entry["text"]
+
+        conditional_headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                conditional_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                conditional_headers["If-Modified-Since"] = entry["last_modified"]
+
+        started = time.perf_counter()
+        try:
+            status, html, headers = await self.fetch_html(url, conditional_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return f"Error fetching website: {e}"
+        finally:
+            self.fetch_seconds.observe(time.perf_counter() - started)
+
+        if status == 304 and entry is not None:
+            # Unchanged upstream: reuse the stored text, skip the parse
+            self.cache.hits += 1
+            self.cache.revalidations += 1
+            self.cache.touch(key)
+            return entry["text"]
+
+        self.cache.misses += 1
+        try:
+            text = await self.parse(html)
+        except Exception as e:
+            # Reported like a failed download, so callers' "Error" checks apply; not cached
+            logger.warning(f"Could not parse {url}: {e}")
+            return f"Error parsing website: {e}"
+        self.cache.put(key, text, headers.get("ETag"), headers.get("Last-Modified"))
+        if self.cache.path:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.save_pool, self.cache.save, self.cache.snapshot())
+            except Exception as e:
+                # The page is fetched and cached in memory; only persisting it failed
+                logger.warning(f"Could not save the page cache to {self.cache.path}: {e}")
+        return text
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "fetch_p95": self.fetch_seconds.percentile(0.95),
+            "parse_p95": self.parse_seconds.percentile(0.95),
+        }
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        self.parse_pool.shutdown(wait=False)
+        self.save_pool.shutdown(wait=True)
@@ -0,0 +1,176 @@
+import os
+import asyncio
+import logging
+
+from agent import custom_messages
+from metrics import REGISTRY
+from response_cache import ResponseCache
+from scheduler import PRIORITY_BACKGROUND, current_generation
+from tokens import count_tokens
+
+logger = logging.getLogger("discord")
+
+# Default for users who have not chosen with !speculate
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "").lower() in ("1", "true", "yes")
+# Seconds after a round or advice before the next one is generated speculatively
+SPECULATION_DELAY = float(os.getenv("SPECULATION_DELAY", "2"))
+
+
+class Speculation:
+    """One speculative completion: its cache key, what it cost so far and whether it was used"""
+
+    def __init__(self, key: str, messages: list):
+        self.key = key
+        self.prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        self.parts = []
+        self.started = False  # A provider is producing it, so joining it beats a new call
+        self.done = False
+        self.used = False
+        self.task = None
+
+    def tokens(self) -> int:
+        """Tokens spent on it so far; nothing until a provider has started on it"""
+        return self.prompt_tokens + count_tokens("".join(self.parts)) if self.started else 0
+
+
+class Speculator:
+    """
+    Generates the prompts a user's next command would send while they are idle, at
+    background priority, through the agent's response cache. When the command arrives
+    with the same context its prompts hit the cache (or join the call in flight)
+    instead of starting cold. Any new turn or offer change makes the prompts stale:
+    discard() cancels what is still running and counts what was spent as wasted.
+
+    `requests_for(user_id)` returns the (system_prompt, user_prompt) pairs to
+    precompute; `enabled(user_id)` says whether the user opted in.
+    """
+
+    def __init__(self, agent, requests_for, enabled, delay: float = SPECULATION_DELAY):
+        self.agent = agent
+        self.requests_for = requests_for
+        self.enabled = enabled
+        self.delay = delay
+        self.timers = {}  # user_id -> task that starts the user's speculations
+        self.speculations = {}  # user_id -> {cache key: Speculation}
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0  # Runs dropped because the rate-limit budget was tight
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+        REGISTRY.callback("speculative_calls_total", "Speculative completions a provider started on",
+                          lambda: self.calls, "counter")
+        REGISTRY.callback("speculative_hits_total", "Commands fully served by speculative completions",
+                          lambda: self.hits, "counter")
+        REGISTRY.callback("speculative_misses_total", "Commands that found no usable speculative completion",
+                          lambda: self.misses, "counter")
+        REGISTRY.callback("speculative_skipped_total", "Speculative runs skipped for lack of rate-limit headroom",
+                          lambda: self.skipped, "counter")
+        REGISTRY.callback("speculative_wasted_tokens_total", "Tokens spent on speculative completions never used",
+                          lambda: self.wasted_tokens, "counter")
+
+    def key(self, system_prompt: str, user_prompt: str) -> str:
+        return ResponseCache.make_key(self.agent.cache_namespace, custom_messages(system_prompt, user_prompt))
+
+    def schedule(self, user_id):
+        """Call when a round or advice has finished: speculate on the next command after SPECULATION_DELAY"""
+        self.discard(user_id)
+        if self.enabled(user_id):
+            self.timers[user_id] = asyncio.create_task(self.run(user_id))
+
+    async def run(self, user_id):
+        # Scheduled from inside a round, but not part of it: a newer message must not withdraw it
+        current_generation.set(None)
+        await asyncio.sleep(self.delay)
+        self.timers.pop(user_id, None)
+        if not await self.agent.has_headroom():
+            # Speculation is optional: leave a tight budget to the commands users actually send
+            self.skipped += 1
+            return
+        try:
+            requests = self.requests_for(user_id)
+        except Exception as e:
+            logger.warning(f"Could not build speculative requests for user {user_id}: {e}")
+            return
+        cache = self.agent.response_cache
+        speculations = self.speculations.setdefault(user_id, {})
+        for system_prompt, user_prompt in requests:
+            messages = custom_messages(system_prompt, user_prompt)
+            key = ResponseCache.make_key(self.agent.cache_namespace, messages)
+            if key in speculations or key in cache.entries or key in cache.in_flight:
+                continue  # Already answered or being answered
+            speculation = speculations[key] = Speculation(key, messages)
+            speculation.task = asyncio.create_task(self.speculate(user_id, speculation, messages))
+
+    async def speculate(self, user_id, speculation: Speculation, messages: list):
+        try:
+            async for delta in self.agent.cached_stream_request(messages, user_id, PRIORITY_BACKGROUND):
+                if not speculation.started:
+                    speculation.started = True
+                    self.calls += 1
+                speculation.parts.append(delta)
+            speculation.done = True
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Speculative generation for user {user_id} failed: {e}")
+
+    def claim(self, user_id, requests: list):
+        """
+        Call when a command is about to send `requests`. Speculations for them that
+        a provider has started are kept for the command to use; ones still queued are
+        cancelled so the command's own call goes out at its normal priority.
+        """
+        if not self.enabled(user_id):
+            return
+        speculations = self.speculations.get(user_id, {})
+        cache = self.agent.response_cache
+        counted = False
+        served = True
+        for system_prompt, user_prompt in requests:
+            key = self.key(system_prompt, user_prompt)
+            speculation = speculations.get(key)
+            if speculation is None and key in cache.entries:
+                continue  # Cached before there was anything to speculate on
+            counted = True
+            usable = speculation is not None and (
+                speculation.key in cache.entries if speculation.done else speculation.started
+            )
+            if usable:
+                speculation.used = True
+                continue
+            served = False
+            if speculation is not None and not speculation.started:
+                speculation.task.cancel()
+        if counted and served:
+            self.hits += 1
+        elif counted:
+            self.misses += 1
+
+    def discard(self, user_id):
+        """The user's context changed: drop their speculations and count unused ones as wasted"""
+        timer = self.timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        for speculation in self.speculations.pop(user_id, {}).values():
+            if speculation.used:
+                self.used_tokens += speculation.tokens()
+            else:
+                self.wasted_tokens += speculation.tokens()
+                speculation.task.cancel()
+
+    def stats(self) -> dict:
+        claims = self.hits + self.misses
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / claims if claims else 0.0,
+            "skipped": self.skipped,
+            "used_tokens": self.used_tokens,
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+    def close(self):
+        for user_id in list(self.timers) + list(self.speculations):
+            self.discard(user_id)
@@ -0,0 +1,370 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("discord")
+
+DB_PATH = os.getenv("BOT_DB_PATH", "bot_state.db")
+HISTORY_FLUSH_INTERVAL = 0.5  # Seconds a history append may wait before it is written
+HISTORY_FLUSH_BATCH = 100  # Flush immediately once this many appends are pending
+
+# Per-user state residency
+USER_IDLE_SECONDS = float(os.getenv("USER_IDLE_SECONDS", str(30 * 60)))
+USER_STATE_BUDGET_BYTES = int(os.getenv("USER_STATE_BUDGET_BYTES", str(256 * 1024 * 1024)))
+USER_STATE_SWEEP_INTERVAL = 60.0
+
+# Statements are kept as constants so sqlite3's statement cache prepares each one
+# once per connection and reuses it
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS offers (
+    user_id INTEGER NOT NULL,
+    offer_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    location TEXT NOT NULL,
+    job_description TEXT NOT NULL,
+    package TEXT NOT NULL,
+    PRIMARY KEY (user_id, offer_id)
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    speaker TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user ON history (user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL,
+    folded INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+SELECT_OFFERS = (
+    "SELECT offer_id, name, title, location, job_description, package "
+    "FROM offers WHERE user_id = ? ORDER BY CAST(offer_id AS INTEGER)"
+)
+UPSERT_OFFER = (
+    "INSERT OR REPLACE INTO offers (user_id, offer_id, name, title, location, job_description, package) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+DELETE_OFFER = "DELETE FROM offers WHERE user_id = ? AND offer_id = ?"
+SELECT_RECENT_HISTORY = (
+    "SELECT speaker, text FROM (SELECT id, speaker, text FROM history WHERE user_id = ? "
+    "ORDER BY id DESC LIMIT ?) ORDER BY id"
+)
+SELECT_HISTORY_RANGE = "SELECT speaker, text FROM history WHERE user_id = ? ORDER BY id LIMIT ? OFFSET ?"
+COUNT_HISTORY = "SELECT COUNT(*) FROM history WHERE user_id = ?"
+INSERT_HISTORY = "INSERT INTO history (user_id, speaker, text, created_at) VALUES (?, ?, ?, ?)"
+SELECT_SUMMARY = "SELECT summary, folded FROM summaries WHERE user_id = ?"
+UPSERT_SUMMARY = "INSERT OR REPLACE INTO summaries (user_id, summary, folded, updated_at) VALUES (?, ?, ?, ?)"
+
+
+class Store:
+    """
+    SQLite (WAL mode) repository for offers, debate history and history summaries.
+    The async methods run on the store's own thread so the event loop never waits on
+    SQLite; history appends are buffered and written there in batches. The sync loaders
+    are for LazyUserMap lookups of users that were not loaded ahead with UserStateManager.load.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self.pending_history = []
+        self.flush_task = None
+
+    def load_offers(self, user_id: int) -> dict:
+        with self.lock:
+            rows = self.conn.execute(SELECT_OFFERS, (user_id,)).fetchall()
+        return {
+            offer_id: {
+                "name": name,
+                "title": title,
+                "location": location,
+                "job_description": job_description,
+                "package": package,
+            }
+            for offer_id, name, title, location, job_description, package in rows
+        }
+
+    async def run(self, fn, *args):
+        """Call fn(*args) on the store's thread"""
+        return await asyncio.get_running_loop().run_in_executor(self.writer, fn, *args)
+
+    def write_offer(self, user_id: int, offer_id: str, data: dict):
+        with self.lock, self.conn:
+            self.conn.execute(UPSERT_OFFER, (
+                user_id, offer_id, data["name"], data["title"], data["location"],
+                data["job_description"], data["package"],
+            ))
+
+    async def save_offer(self, user_id: int, offer_id: str, data: dict):
+        await self.run(self.write_offer, user_id, offer_id, dict(data))
+
+    def write_offer_deletion(self, user_id: int, offer_id: str):
+        with self.lock, self.conn:
+            self.conn.execute(DELETE_OFFER, (user_id, offer_id))
+
+    async def delete_offer(self, user_id: int, offer_id: str):
+        await self.run(self.write_offer_deletion, user_id, offer_id)
+
+    def load_history(self, user_id: int, limit: int) -> list:
+        """The user's most recent `limit` turns, oldest first (including unflushed ones)"""
+        # Under the lock a flushed batch is either committed or still pending, never both or neither
+        with self.lock:
+            rows = self.conn.execute(SELECT_RECENT_HISTORY, (user_id, limit)).fetchall()
+            pending = [(speaker, text) for uid, speaker, text, _ in list(self.pending_history) if uid == user_id]
+        return (rows + pending)[-limit:]
+
+    def read_history_count(self, user_id: int) -> int:
+        with self.lock:
+            return self.conn.execute(COUNT_HISTORY, (user_id,)).fetchone()[0]
+
+    async def count_history(self, user_id: int) -> int:
+        """Turns written for the user so far; call flush() first to include buffered ones"""
+        return await self.run(self.read_history_count, user_id)
+
+    def read_history_range(self, user_id: int, start: int, stop: int) -> list:
+        with self.lock:
+            return self.conn.execute(SELECT_HISTORY_RANGE, (user_id, stop - start, start)).fetchall()
+
+    async def load_history_range(self, user_id: int, start: int, stop: int) -> list:
+        """Written turns start..stop-1 of the user's history, counted from their first turn"""
+        return await self.run(self.read_history_range, user_id, start, stop)
+
+    def load_summary(self, user_id: int):
+        """(summary, turns it covers) of the user's compacted history, or None"""
+        with self.lock:
+            return self.conn.execute(SELECT_SUMMARY, (user_id,)).fetchone()
+
+    def write_summary(self, user_id: int, summary: str, folded: int):
+        with self.lock, self.conn:
+            self.conn.execute(UPSERT_SUMMARY, (user_id, summary, folded, time.time()))
+
+    async def save_summary(self, user_id: int, summary: str, folded: int):
+        await self.run(self.write_summary, user_id, summary, folded)
+
+    def append_history(self, user_id: int, speaker: str, text: str):
+        """Buffer a turn; it is written by the next batched flush"""
+        self.pending_history.append((user_id, speaker, text, time.time()))
+        if len(self.pending_history) >= HISTORY_FLUSH_BATCH:
+            self.schedule_flush(0)
+        else:
+            self.schedule_flush(HISTORY_FLUSH_INTERVAL)
+
+    def schedule_flush(self, delay: float):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_after(delay))
+        elif delay == 0:
+            self.flush_task.cancel()
+            self.flush_task = asyncio.create_task(self.flush_after(0))
+
+    async def flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    def write_history(self):
+        """Commit the buffered turns, then drop them from the buffer, both under the lock"""
+        with self.lock:
+            batch = self.pending_history[:]
+            if not batch:
+                return
+            try:
+                with self.conn:
+                    self.conn.executemany(INSERT_HISTORY, batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} history entries: {e}")
+                return
+            # Turns appended since the copy stay buffered for the next flush
+            del self.pending_history[:len(batch)]
+
+    async def flush(self):
+        """Write all buffered history in one transaction on the writer thread"""
+        if self.pending_history:
+            await self.run(self.write_history)
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.flush()
+        self.writer.shutdown(wait=True)
+        with self.lock:
+            self.conn.close()
+
+
+class LazyUserMap(dict):
+    """
+    dict of user_id -> state that loads a user's state through `loader` the first
+    time the user is looked up, so startup does not read every user at once.
+    Users the loader returns nothing for stay absent.
+    """
+
+    def __init__(self, loader, on_load=None):
+        super().__init__()
+        self.loader = loader
+        self.on_load = on_load
+        self.loaded = set()
+
+    def ensure_loaded(self, user_id):
+        if user_id not in self.loaded:
+            self.loaded.add(user_id)
+            if self.on_load is not None:
+                self.on_load(user_id)
+            value = self.loader(user_id)
+            if value:
+                dict.__setitem__(self, user_id, value)
+
+    async def load(self, user_id, store: "Store"):
+        """ensure_loaded with the loader run on the store's thread instead of the event loop"""
+        if user_id in self.loaded:
+            return
+        value = await store.run(self.loader, user_id)
+        if user_id not in self.loaded:  # Unless it was looked up or set meanwhile
+            self.loaded.add(user_id)
+            if self.on_load is not None:
+                self.on_load(user_id)
+            if value:
+                dict.__setitem__(self, user_id, value)
+
+    def __contains__(self, user_id):
+        self.ensure_loaded(user_id)
+        return dict.__contains__(self, user_id)
+
+    def __getitem__(self, user_id):
+        self.ensure_loaded(user_id)
+        return dict.__getitem__(self, user_id)
+
+    def get(self, user_id, default=None):
+        self.ensure_loaded(user_id)
+        return dict.get(self, user_id, default)
+
+    def __setitem__(self, user_id, value):
+        self.loaded.add(user_id)
+        dict.__setitem__(self, user_id, value)
+
+    def evict(self, user_id):
+        """Forget a user; the next lookup reloads them through `loader`"""
+        self.loaded.discard(user_id)
+        dict.pop(self, user_id, None)
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate resident size of an object graph of builtins and plain objects"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+class UserStateManager:
+    """
+    Keeps per-user state bounded. Users idle longer than `idle_seconds` are evicted,
+    and least recently active users are evicted while resident state exceeds
+    `budget_bytes`. Evicted state lives on in the Store and is reloaded by the
+    LazyUserMaps on the user's next message.
+    """
+
+    def __init__(self, store: Store, maps: list, caches: list = (),
+                 idle_seconds: float = USER_IDLE_SECONDS, budget_bytes: int = USER_STATE_BUDGET_BYTES):
+        self.store = store
+        self.maps = maps  # LazyUserMaps reloaded from the store
+        self.caches = caches  # Plain dicts keyed by user id, rebuilt on demand
+        self.idle_seconds = idle_seconds
+        self.budget_bytes = budget_bytes
+        self.last_active = OrderedDict()  # user_id -> monotonic time, least recent first
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.sweep_task = None
+        REGISTRY.callback("user_state_resident_users", "Users with state in memory", self.last_active.__len__)
+        REGISTRY.callback("user_state_resident_bytes", "Resident per-user state as of the last sweep",
+                          lambda: self.resident_bytes)
+        REGISTRY.callback("user_state_evictions_total", "Users whose state was evicted from memory",
+                          lambda: self.evictions, "counter")
+
+    def touch(self, user_id):
+        self.last_active[user_id] = time.monotonic()
+        self.last_active.move_to_end(user_id)
+
+    async def load(self, user_id):
+        """Load the user's state off the event loop ahead of a command that reads it"""
+        self.touch(user_id)
+        for m in self.maps:
+            await m.load(user_id, self.store)
+
+    def user_bytes(self, user_id) -> int:
+        seen = set()
+        return sum(deep_sizeof(m[user_id], seen) for m in list(self.maps) + list(self.caches)
+                   if dict.__contains__(m, user_id))
+
+    def evict(self, user_id):
+        for m in self.maps:
+            m.evict(user_id)
+        for cache in self.caches:
+            cache.pop(user_id, None)
+        self.last_active.pop(user_id, None)
+        self.evictions += 1
+
+    async def sweep(self):
+        """Evict idle users, then least recently active users until under budget"""
+        # Put buffered history on disk before any state is released. Appends made
+        # after this are still merged in by Store.load_history on reload.
+        await self.store.flush()
+
+        now = time.monotonic()
+        for user_id, last in list(self.last_active.items()):
+            if now - last < self.idle_seconds:
+                break
+            self.evict(user_id)
+
+        sizes = {user_id: self.user_bytes(user_id) for user_id in self.last_active}
+        self.resident_bytes = sum(sizes.values())
+        for user_id in list(self.last_active):
+            if self.resident_bytes <= self.budget_bytes:
+                break
+            self.resident_bytes -= sizes[user_id]
+            self.evict(user_id)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(USER_STATE_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"User state sweep failed: {e}")
+
+    def start(self):
+        if self.sweep_task is None or self.sweep_task.done():
+            self.sweep_task = asyncio.create_task(self.run())
+
+    def stats(self) -> dict:
+        """Gauges as of the last sweep (resident users is live)"""
+        return {
+            "resident_users": len(self.last_active),
+            "resident_bytes": self.resident_bytes,
+            "evictions": self.evictions,
+        }
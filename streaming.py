@@ -0,0 +1,340 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("discord")
+
+PLACEHOLDER = "…"
+MESSAGE_LIMIT = 2000
+MESSAGE_EDIT_INTERVAL = 1.5  # Seconds between edits of one message
+# Discord allows roughly 5 message edits per 5 seconds in a channel, shared by every
+# reply streaming into it, so edits are also spaced per channel
+CHANNEL_EDIT_INTERVAL = 1.0
+# Discord's bucket for posting messages: 5 per 5 seconds per channel. Sends wait for
+# room in it here, in order, rather than running into 429s
+CHANNEL_SENDS_PER_WINDOW = int(os.getenv("DISCORD_CHANNEL_SENDS_PER_WINDOW", "5"))
+CHANNEL_SEND_WINDOW = 5.0
+# Embed limits: description, total text per message (across embeds) and embeds per message
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_TOTAL_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+EMBED_COLOR = discord.Color.blue()
+
+# channel id -> earliest time the next intermediate edit may go out
+channel_next_edit = {}
+
+send_seconds = REGISTRY.histogram("discord_send_seconds", "Latency of posting a message to Discord", op="send")
+edit_seconds = REGISTRY.histogram("discord_send_seconds", "Latency of posting a message to Discord", op="edit")
+send_wait_seconds = REGISTRY.histogram("discord_send_wait_seconds", "Time a message waited for its channel's send bucket")
+
+
+class ChannelSendQueue:
+    """
+    Orders the sends to one channel and spaces them to fit its rate-limit bucket: a
+    send waits until fewer than `limit` went out in the last `window` seconds.
+    """
+
+    def __init__(self, limit: int = CHANNEL_SENDS_PER_WINDOW, window: float = CHANNEL_SEND_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.sent = deque()  # Send times within the window
+        self.lock = asyncio.Lock()  # FIFO, so sends keep their order
+
+    async def send(self, send, *args, **kwargs):
+        async with self.lock:
+            now = time.monotonic()
+            while self.sent and now - self.sent[0] >= self.window:
+                self.sent.popleft()
+            if len(self.sent) >= self.limit:
+                wait = self.sent[0] + self.window - now
+                send_wait_seconds.observe(wait)
+                await asyncio.sleep(wait)
+                self.sent.popleft()
+            self.sent.append(time.monotonic())
+        return await send(*args, **kwargs)
+
+
+# channel id -> ChannelSendQueue
+channel_queues = {}
+
+
+def channel_id_of(send):
+    """Channel a bound send method (message.reply, ctx.send, channel.send) posts to"""
+    owner = getattr(send, "__self__", None)
+    channel = getattr(owner, "channel", owner)
+    return getattr(channel, "id", None)
+
+
+async def send_message(send, content: str = None, **kwargs):
+    """
+    Post with `send` (message.reply, ctx.send, ...) through the channel's send queue,
+    recording the send latency. Content over the 2000-character limit is split into
+    several messages; the first one is returned.
+    """
+    channel_id = channel_id_of(send)
+    queue = channel_queues.get(channel_id)
+    if queue is None and channel_id is not None:
+        queue = channel_queues[channel_id] = ChannelSendQueue()
+    parts = split_message(content) if content else [content]
+    first = None
+    for i, part in enumerate(parts):
+        # Embeds, views and files go with the last part
+        extra = kwargs if i == len(parts) - 1 else {}
+        started = time.perf_counter()
+        try:
+            message = await (queue.send(send, part, **extra) if queue is not None else send(part, **extra))
+        finally:
+            send_seconds.observe(time.perf_counter() - started)
+        first = first or message
+    return first
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Split text into parts of at most `limit` characters, preferring paragraph, line,
+    sentence and word boundaries. A code block cut in two is closed and reopened.
+    """
+    parts = []
+    while len(text) > limit:
+        window = text[:limit - 4]  # Room to close a code fence
+        cut = -1
+        for separator in ("\n\n", "\n", ". ", " "):
+            cut = window.rfind(separator)
+            if cut > limit // 4:
+                cut += len(separator)
+                break
+        if cut <= limit // 4:
+            cut = len(window)
+        part, text = window[:cut], text[cut:]
+        if part.count("```") % 2:
+            part += "\n```"
+            text = "```\n" + text
+        parts.append(part.rstrip())
+        text = text.lstrip(" ") if not text.startswith("```") else text
+    if text.strip() or not parts:
+        parts.append(text)
+    return parts
+
+
+def paginate(sections: list, limit: int = EMBED_DESCRIPTION_LIMIT) -> list:
+    """Pack (header, text) sections into pages of at most `limit` characters, splitting long ones"""
+    pages = []
+    page = ""
+    for header, text in sections:
+        continued = header.rstrip(":\n") + " (continued):\n"
+        chunks = split_message(text or PLACEHOLDER, limit - len(continued) - 2)
+        for i, chunk in enumerate(chunks):
+            block = (header if i == 0 else continued) + chunk
+            if page and len(page) + 2 + len(block) > limit:
+                pages.append(page)
+                page = ""
+            page = f"{page}\n\n{block}" if page else block
+    if page or not pages:
+        pages.append(page)
+    return pages
+
+
+def build_embeds(title: str, pages: list) -> list:
+    """One embed per page; pages after the first are numbered in the footer"""
+    embeds = []
+    for i, page in enumerate(pages):
+        embed = discord.Embed(title=title if i == 0 else None, description=page, color=EMBED_COLOR)
+        if len(pages) > 1:
+            embed.set_footer(text=f"Page {i + 1}/{len(pages)}")
+        embeds.append(embed)
+    return embeds
+
+
+def group_embeds(embeds: list) -> list:
+    """Split embeds into messages within Discord's per-message embed count and text total"""
+    groups = [[]]
+    total = 0
+    for embed in embeds:
+        size = len(embed)
+        if groups[-1] and (len(groups[-1]) == EMBEDS_PER_MESSAGE or total + size > EMBED_TOTAL_LIMIT):
+            groups.append([])
+            total = 0
+        groups[-1].append(embed)
+        total += size
+    return groups
+
+
+async def send_embeds(send, title: str, sections: list) -> list:
+    """Post (header, text) sections as paginated embeds in as few messages as fit"""
+    groups = group_embeds(build_embeds(title, paginate(sections)))
+    return [await send_message(send, embeds=group) for group in groups]
+
+
+class StreamingMessage:
+    """A Discord message that is edited in place while a streamed reply grows"""
+
+    def __init__(self, message: discord.Message, header: str):
+        self.message = message
+        self.header = header
+        self.shown = message.content
+        self.last_edit = time.monotonic()
+        self.overflow = []  # Follow-up messages holding text past the message limit
+
+    @classmethod
+    async def send(cls, send, header: str):
+        """Post the placeholder with `send` (message.reply, ctx.send, ...)"""
+        message = await send_message(send, f"{header}{PLACEHOLDER}")
+        return cls(message, header)
+
+    def edit_slot_free(self) -> bool:
+        """Claim an intermediate edit if both the message and its channel are due one"""
+        now = time.monotonic()
+        if now - self.last_edit < MESSAGE_EDIT_INTERVAL:
+            return False
+        channel_id = self.message.channel.id
+        if now < channel_next_edit.get(channel_id, 0.0):
+            return False
+        channel_next_edit[channel_id] = now + CHANNEL_EDIT_INTERVAL
+        return True
+
+    async def edit(self, body: str):
+        """Show body while it streams; only the first MESSAGE_LIMIT characters fit"""
+        await self.show(f"{self.header}{body}"[:MESSAGE_LIMIT])
+
+    async def show(self, content: str):
+        if content != self.shown:
+            started = time.perf_counter()
+            try:
+                await self.message.edit(content=content)
+            finally:
+                edit_seconds.observe(time.perf_counter() - started)
+            self.shown = content
+        self.last_edit = time.monotonic()
+
+    async def complete(self, body: str):
+        """Show the final body in full: what does not fit goes on in follow-up messages"""
+        first, *rest = split_message(f"{self.header}{body}")
+        await self.show(first)
+        for i, part in enumerate(rest):
+            if i < len(self.overflow):
+                await self.overflow[i].edit(content=part)
+            else:
+                self.overflow.append(await send_message(self.message.channel.send, part))
+
+    async def consume(self, deltas) -> str:
+        """Render an async iterator of text deltas into the message; returns the full text"""
+        parts = []
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                # Deltas that arrive between edits are coalesced into the next one
+                if self.edit_slot_free():
+                    await self.edit(f"{''.join(parts)} {PLACEHOLDER}")
+        except asyncio.CancelledError:
+            await self.complete(f"{''.join(parts)}\n*(superseded by your newer message)*")
+            raise
+        except Exception:
+            await self.complete(f"{''.join(parts)}\n*(response failed)*")
+            raise
+        text = "".join(parts)
+        await self.complete(text)
+        return text
+
+    async def finish(self, text: str) -> str:
+        """Replace the placeholder with a reply that was not streamed"""
+        await self.complete(text)
+        return text
+
+
+class RoundMessage(StreamingMessage):
+    """
+    Every company's reply in a round, packed into paginated embeds in one message (or
+    as few as fit) instead of one message each. Sections fill in, or stream in through
+    section(i), and the message is edited on the same schedule as a StreamingMessage.
+    """
+
+    def __init__(self, send, title: str, headers: list):
+        self.message = None
+        self.header = ""
+        self.shown = None
+        self.last_edit = time.monotonic()
+        self.send_with = send
+        self.title = title
+        self.sections = [[header, ""] for header in headers]
+        self.messages = []  # Posted messages; only the first is edited while streaming
+
+    def section(self, index: int):
+        return RoundSection(self, index)
+
+    def render(self) -> list:
+        return group_embeds(build_embeds(self.title, paginate(self.sections)))
+
+    async def start(self):
+        """Post the round with placeholders, for replies that will stream in"""
+        self.messages = [await send_message(self.send_with, embeds=self.render()[0])]
+        self.message = self.messages[0]
+        self.last_edit = time.monotonic()
+
+    async def set(self, index: int, text: str, show: bool = True):
+        """Fill in a finished reply; with `show`, post the round or edit it in if an edit is due"""
+        self.sections[index][1] = text
+        if not show:
+            return
+        if self.message is None:
+            await self.start()
+        elif self.edit_slot_free():
+            await self.edit(None)
+
+    async def edit(self, body):
+        embeds = self.render()[0]
+        shown = [embed.to_dict() for embed in embeds]
+        if shown != self.shown:
+            started = time.perf_counter()
+            try:
+                await self.message.edit(embeds=embeds)
+            finally:
+                edit_seconds.observe(time.perf_counter() - started)
+            self.shown = shown
+        self.last_edit = time.monotonic()
+
+    async def finish(self, text: str = None):
+        """Show every section in full, editing the posted messages and sending any overflow"""
+        groups = self.render()
+        for i, group in enumerate(groups):
+            if i < len(self.messages):
+                if i > 0 or [embed.to_dict() for embed in group] != self.shown:
+                    await self.messages[i].edit(embeds=group)
+            else:
+                self.messages.append(await send_message(self.send_with, embeds=group))
+        self.shown = [embed.to_dict() for embed in groups[0]]
+
+
+class RoundSection:
+    """One company's part of a RoundMessage, with StreamingMessage's consume/finish interface"""
+
+    def __init__(self, round_message: RoundMessage, index: int):
+        self.round = round_message
+        self.index = index
+
+    async def consume(self, deltas) -> str:
+        parts = []
+        section = self.round.sections[self.index]
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                section[1] = f"{''.join(parts)} {PLACEHOLDER}"
+                if self.round.edit_slot_free():
+                    await self.round.edit(None)
+        except asyncio.CancelledError:
+            section[1] = f"{''.join(parts)}\n*(superseded by your newer message)*"
+            raise
+        except Exception:
+            section[1] = f"{''.join(parts)}\n*(response failed)*"
+            raise
+        section[1] = "".join(parts)
+        return section[1]
+
+    async def finish(self, text: str) -> str:
+        self.round.sections[self.index][1] = text
+        return text
@@ -0,0 +1,80 @@
+import pytest
+
+from context import TRIM_STAGES, DebateContext
+from tokens import count_tokens
+
+OFFERS = {
+    "1": {
+        "name": "Acme",
+        "title": "Engineer",
+        "location": "Remote",
+        "job_description": "Build reliable services for our customers. " * 200,
+        "package": "100k",
+    },
+}
+
+
+def debate(turns: int = 12, summary: str = None) -> DebateContext:
+    history = [("Company Acme" if i % 2 else "Candidate", f"turn {i}: " + "we offer growth " * 10)
+               for i in range(turns)]
+    return DebateContext(history, summary=summary)
+
+
+def test_unbudgeted_context_keeps_everything():
+    text, tokens = debate().render(OFFERS)
+    assert OFFERS["1"]["job_description"].strip() in text
+    assert "[Candidate]: turn 0:" in text and "turn 11:" in text
+    assert tokens == count_tokens(text)
+
+
+@pytest.mark.parametrize("budget", [5000, 2500, 1200, 600, 300])
+def test_budgeted_context_fits(budget):
+    text, tokens = debate(summary="The candidate wants remote work. " * 40).render(OFFERS, budget)
+    assert tokens <= budget
+    assert tokens == count_tokens(text)
+
+
+def test_descriptions_are_cut_before_turns_are_dropped():
+    context = debate()
+    full_tokens = context.render(OFFERS)[1]
+    description_tokens = count_tokens(OFFERS["1"]["job_description"])
+    # Room for everything once descriptions are capped at the second stage's limit
+    budget = full_tokens - description_tokens + TRIM_STAGES[1][0] + 50
+
+    text, _ = context.render(OFFERS, budget)
+
+    assert "turn 0:" in text and "turn 11:" in text
+    assert "[...]" in text
+    assert context.kept_turns() == 12
+
+
+def test_tight_budget_keeps_the_latest_turns():
+    context = debate(turns=20)
+    text, tokens = context.render(OFFERS, 700)
+
+    assert "turn 19:" in text
+    assert "turn 0:" not in text
+    assert context.kept_turns() < 20
+
+
+def test_summary_is_shown_and_capped():
+    summary = "The candidate cares most about mentorship. " * 100
+    context = debate(summary=summary)
+
+    full, _ = context.render(OFFERS)
+    trimmed, _ = context.render(OFFERS, 800)
+
+    assert "### Earlier in the Debate (summary) ###" in full
+    assert summary.strip() in full
+    assert "### Earlier in the Debate (summary) ###" in trimmed
+    assert summary.strip() not in trimmed
+
+
+def test_skip_trailing_leaves_out_the_last_speaker():
+    context = debate()
+    context.append_turn("Advisor", "Take the Acme offer.")
+
+    text, _ = context.render(OFFERS, 5000, skip_trailing="Advisor")
+
+    assert "Take the Acme offer." not in text
+    assert "turn 11:" in text
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+pytest.importorskip("lxml")  # extract.py needs lxml; scraper.py falls back without it
+
+from extract import EMPTY_RESULT, extract_job_posting, format_job_posting
+
+
+def page(head: str = "", body: str = "") -> str:
+    return f"<html><head>{head}</head><body>{body}</body></html>"
+
+
+def json_ld(data) -> str:
+    return f'<script type="application/ld+json">{json.dumps(data)}</script>'
+
+
+POSTING = {
+    "@context": "https://schema.org",
+    "@type": "JobPosting",
+    "title": "Backend Engineer",
+    "hiringOrganization": {"@type": "Organization", "name": "Acme"},
+    "jobLocation": {"@type": "Place", "address": {"addressLocality": "Berlin", "addressCountry": "DE"}},
+    "baseSalary": {
+        "@type": "MonetaryAmount",
+        "currency": "EUR",
+        "value": {"@type": "QuantitativeValue", "minValue": 70000, "maxValue": 90000, "unitText": "YEAR"},
+    },
+    "employmentType": "FULL_TIME",
+    "description": (
+        "<p>Join the platform team that runs our payment services for millions of customers.</p>"
+        "<h3>Responsibilities</h3><ul><li>Design APIs</li><li>Run services in production</li></ul>"
+        "<h3>Requirements</h3><ul><li>Python</li><li>PostgreSQL</li></ul>"
+    ),
+}
+
+
+def test_json_ld_fields():
+    fields = extract_job_posting(page(json_ld(POSTING), "<nav>Jobs | About</nav><h1>Ignored</h1>"))
+
+    assert fields["title"] == "Backend Engineer"
+    assert fields["company"] == "Acme"
+    assert fields["location"] == "Berlin, DE"
+    assert fields["salary"] == "70,000–90,000 EUR per year"
+    assert fields["employment_type"] == "full time"
+    assert fields["responsibilities"] == ["Design APIs", "Run services in production"]
+    assert fields["requirements"] == ["Python", "PostgreSQL"]
+    assert "payment services" in fields["summary"]
+
+
+def test_json_ld_inside_graph():
+    head = json_ld({"@context": "https://schema.org", "@graph": [{"@type": "WebPage"}, POSTING]})
+    assert extract_job_posting(page(head))["title"] == "Backend Engineer"
+
+
+def test_invalid_json_ld_is_skipped():
+    head = '<script type="application/ld+json">{not json</script>' + json_ld(POSTING)
+    assert extract_job_posting(page(head))["company"] == "Acme"
+
+
+def test_meta_tags_when_there_is_no_json_ld():
+    head = ('<meta property="og:title" content="Data Scientist at Initech">'
+            '<meta name="description" content="Model churn for our subscription business.">')
+    body = "<main><p>Location: Austin, TX</p><p>" + "We build forecasting tools for retail. " * 8 + "</p></main>"
+
+    fields = extract_job_posting(page(head, body))
+
+    assert fields["title"] == "Data Scientist at Initech"
+    assert fields["summary"] == "Model churn for our subscription business."
+    assert fields["location"] == "Austin, TX"
+
+
+def test_boilerplate_is_left_out():
+    body = ('<div class="cookie-banner"><p>We use cookies to improve your experience on this site.</p></div>'
+            "<h1>Site Reliability Engineer</h1>"
+            "<div><p>" + "Keep our fleet healthy and our pagers quiet. " * 6 + "</p>"
+            "<h2>What you'll do</h2><ul><li>Own the on-call rotation</li><li>Automate toil away</li></ul></div>")
+
+    fields = extract_job_posting(page(body=body))
+
+    assert fields["title"] == "Site Reliability Engineer"
+    assert fields["responsibilities"] == ["Own the on-call rotation", "Automate toil away"]
+    assert "cookies" not in fields["summary"]
+
+
+def test_format_job_posting():
+    text = format_job_posting({"title": "Engineer", "salary": "100k", "requirements": ["Python"]})
+    assert text == "Title: Engineer\nSalary: 100k\nRequirements:\n- Python"
+
+
+@pytest.mark.parametrize("html", ["", "   ", "<html></html>"])
+def test_empty_pages(html):
+    assert format_job_posting(extract_job_posting(html)) == EMPTY_RESULT
+
+
+def test_non_string_salary_unit():
+    posting = dict(POSTING, baseSalary={"currency": "USD", "value": {"value": 50, "unitText": 1}})
+    fields = extract_job_posting(page(json_ld(posting)))
+    assert fields["salary"] == "50 USD"
+    assert fields["title"] == "Backend Engineer"
+
+
+def test_xml_declaration_pages():
+    declaration = '<?xml version="1.0" encoding="utf-8"?>'
+    assert extract_job_posting(declaration) == {}
+    fields = extract_job_posting(declaration + page(json_ld(POSTING)))
+    assert fields["company"] == "Acme"
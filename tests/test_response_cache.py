@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from agent import BaseAgent
+from response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "Which offer pays more?"}]
+
+
+class FakeAgent(BaseAgent):
+    """Answers after `delay` seconds, counting the calls that reach the 'provider'"""
+
+    def __init__(self, delay: float = 0.05, error: Exception = None):
+        super().__init__("test-model")
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def queue_request(self, messages, user_id=None, priority: int = 0):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f"answer {self.calls}"
+
+    async def queue_stream_request(self, messages, user_id=None, priority: int = 0):
+        yield await self.queue_request(messages, user_id, priority)
+
+    def cancel_pending(self, user_id, generation) -> int:
+        return 0
+
+    async def has_headroom(self) -> bool:
+        return True
+
+
+def test_identical_requests_share_one_call():
+    async def run():
+        agent = FakeAgent()
+        results = await asyncio.gather(*(agent.cached_request(MESSAGES, user_id=1) for _ in range(3)))
+        return agent, results
+
+    agent, results = asyncio.run(run())
+    assert results == ["answer 1"] * 3
+    assert agent.calls == 1
+    assert agent.response_cache.shared == 2
+
+
+def test_waiter_takes_over_when_owner_is_cancelled():
+    async def run():
+        agent = FakeAgent()
+        owner = asyncio.create_task(agent.cached_request(MESSAGES, user_id=1))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(agent.cached_request(MESSAGES, user_id=1))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        result = await waiter
+        return agent, owner, result
+
+    agent, owner, result = asyncio.run(run())
+    assert owner.cancelled()
+    # The waiter is not cancelled with the owner: it makes the call itself
+    assert result == "answer 2"
+    assert agent.calls == 2
+    assert not agent.response_cache.in_flight
+
+
+def test_owner_failure_reaches_waiters_and_is_not_cached():
+    async def run():
+        agent = FakeAgent(error=RuntimeError("provider down"))
+        results = await asyncio.gather(*(agent.cached_request(MESSAGES, user_id=1) for _ in range(2)),
+                                       return_exceptions=True)
+        return agent, results
+
+    agent, results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert agent.calls == 1
+    assert not agent.response_cache.entries
+
+
+def test_invalidate_drops_only_the_tagged_entries():
+    cache = ResponseCache()
+    cache.store("a", "reply a", tag=1)
+    cache.store("b", "reply b", tag=2)
+
+    cache.invalidate(1)
+
+    assert cache.lookup("a") is None
+    assert cache.lookup("b") == "reply b"
+    assert cache.size == ResponseCache.entry_size("b", "reply b")
+
+
+@pytest.mark.parametrize("max_bytes", [0, 10])
+def test_entries_over_the_byte_budget_are_evicted(max_bytes):
+    cache = ResponseCache(max_bytes=max_bytes)
+    cache.store("key", "a reply longer than the budget")
+    assert not cache.entries and cache.size == 0
@@ -0,0 +1,79 @@
+import asyncio
+
+import scheduler
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_BULK, PRIORITY_INTERACTIVE, FairQueue, FairScheduler, LLMRequest
+
+
+def request(user_id, chars=400, priority=PRIORITY_INTERACTIVE):
+    # The scheduler never touches the future, so tests can leave it out
+    return LLMRequest([{"role": "user", "content": "x" * chars}], None, user_id=user_id, priority=priority)
+
+
+def test_fair_queue_interleaves_users():
+    queue = FairQueue(quantum=500)
+    for _ in range(5):
+        queue.put(request("heavy"))
+    queue.put(request("light"))
+
+    order = [queue.pop().user_id for _ in range(6)]
+
+    # Each request costs 400 estimated tokens: one per turn, so the light user goes second
+    assert order[:2] == ["heavy", "light"]
+    assert len(queue) == 0
+
+
+def test_fair_queue_deficit_carries_over():
+    queue = FairQueue(quantum=500)
+    for _ in range(3):
+        queue.put(request("a", chars=1200))  # 600 tokens: more than one quantum
+        queue.put(request("b", chars=400))  # 400 tokens
+
+    order = [queue.pop().user_id for _ in range(6)]
+
+    assert order.count("a") == 3 and order.count("b") == 3
+    # b never waits behind more than one of a's requests
+    assert "a,a" not in ",".join(order[:4])
+
+
+def test_fair_queue_remove_generation():
+    queue = FairQueue()
+    old, new = object(), object()
+    first = request(1)
+    first.generation = old
+    second = request(1)
+    second.generation = new
+    queue.put(first)
+    queue.put(second)
+
+    assert queue.remove(1, old) == [first]
+    assert len(queue) == 1
+    assert queue.pop() is second
+
+
+def test_scheduler_serves_higher_priority_first():
+    async def run():
+        queue = FairScheduler()
+        queue.put(request(1, priority=PRIORITY_BACKGROUND))
+        queue.put(request(2, priority=PRIORITY_BULK))
+        queue.put(request(3, priority=PRIORITY_INTERACTIVE))
+        return [(await queue.get()).priority for _ in range(3)]
+
+    assert asyncio.run(run()) == [PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BACKGROUND]
+
+
+def test_scheduler_promotes_starved_bulk_but_not_background(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_MAX_WAIT", 5)
+
+    async def run():
+        queue = FairScheduler()
+        background = request(1, priority=PRIORITY_BACKGROUND)
+        bulk = request(2, priority=PRIORITY_BULK)
+        background.enqueued_at -= 60
+        bulk.enqueued_at -= 10
+        queue.put(background)
+        queue.put(bulk)
+        queue.put(request(3, priority=PRIORITY_INTERACTIVE))
+        queue.put(request(4, priority=PRIORITY_INTERACTIVE))
+        return [(await queue.get()).priority for _ in range(4)]
+
+    assert asyncio.run(run()) == [PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from scraper import PageCache, PageFetcher, normalize_url
+
+
+@pytest.mark.parametrize("url", [
+    "https://Jobs.Example.com/careers/123",
+    "https://jobs.example.com:443/careers/123/",
+    "HTTPS://jobs.example.com/careers/123#apply",
+    "https://jobs.example.com/careers/123?utm_source=linkedin&gclid=abc",
+    " https://jobs.example.com/careers/123 ",
+])
+def test_variants_share_one_key(url):
+    assert normalize_url(url) == "https://jobs.example.com/careers/123"
+
+
+def test_query_order_does_not_matter():
+    assert normalize_url("http://a.com/j?b=2&a=1") == normalize_url("http://a.com/j?a=1&b=2")
+
+
+def test_distinct_pages_keep_distinct_keys():
+    keys = {
+        normalize_url("https://a.com/jobs/1"),
+        normalize_url("https://a.com/jobs/2"),
+        normalize_url("https://a.com/jobs/1?id=7"),
+        normalize_url("https://a.com:8443/jobs/1"),
+        normalize_url("http://a.com/jobs/1"),
+    }
+    assert len(keys) == 5
+
+
+def test_fetcher_downloads_each_normalized_url_once():
+    async def run():
+        fetcher = PageFetcher(cache=PageCache())
+        downloads = []
+
+        async def fetch_html(url, headers=None):
+            downloads.append(url)
+            return 200, "<html><body><p>Build things.</p></body></html>", {}
+
+        fetcher.fetch_html = fetch_html
+        try:
+            texts = [await fetcher.fetch_website_info(url) for url in (
+                "https://jobs.example.com/1?utm_campaign=x",
+                "https://JOBS.example.com/1/",
+                "https://jobs.example.com/1#top",
+            )]
+        finally:
+            await fetcher.close()
+        return fetcher, downloads, texts
+
+    fetcher, downloads, texts = asyncio.run(run())
+    assert len(downloads) == 1
+    assert len(set(texts)) == 1
+    assert fetcher.cache.hits == 2 and fetcher.cache.misses == 1
+
+
+def fake_fetcher(cache: PageCache) -> PageFetcher:
+    fetcher = PageFetcher(cache=cache)
+
+    async def fetch_html(url, headers=None):
+        await asyncio.sleep(0.001)
+        return 200, f"<html><body><p>Posting at {url}</p></body></html>", {}
+
+    fetcher.fetch_html = fetch_html
+    return fetcher
+
+
+def test_concurrent_misses_persist_the_cache(tmp_path):
+    path = tmp_path / "pages.json"
+
+    async def run():
+        fetcher = fake_fetcher(PageCache(path=str(path)))
+        try:
+            return await asyncio.gather(*(fetcher.fetch_website_info(f"https://jobs.example.com/{i}")
+                                          for i in range(100)))
+        finally:
+            await fetcher.close()
+
+    texts = asyncio.run(run())
+
+    assert all("Posting at" in text for text in texts)
+    assert len(PageCache(path=str(path)).entries) == 100
+    assert [p.name for p in tmp_path.iterdir()] == ["pages.json"]  # No tmp files left behind
+
+
+def test_failed_save_does_not_fail_the_fetch(tmp_path):
+    async def run():
+        fetcher = fake_fetcher(PageCache(path=str(tmp_path / "missing-dir" / "pages.json")))
+        try:
+            return await fetcher.fetch_website_info("https://jobs.example.com/1")
+        finally:
+            await fetcher.close()
+
+    assert "Posting at" in asyncio.run(run())
+
+
+def test_unparseable_page_is_reported_as_an_error():
+    async def run():
+        fetcher = fake_fetcher(PageCache())
+
+        async def parse(html):
+            raise ValueError("bad markup")
+
+        fetcher.parse = parse
+        try:
+            return fetcher, await fetcher.fetch_website_info("https://jobs.example.com/1")
+        finally:
+            await fetcher.close()
+
+    fetcher, text = asyncio.run(run())
+    assert text.startswith("Error")
+    assert not fetcher.cache.entries
@@ -0,0 +1,46 @@
+import pytest
+
+from streaming import MESSAGE_LIMIT, split_message
+
+
+def test_short_text_is_one_part():
+    assert split_message("hello") == ["hello"]
+    assert split_message("") == [""]
+
+
+def test_parts_fit_the_limit_and_keep_the_text():
+    text = "\n\n".join(f"Paragraph {i}. " + "Some words about the offer. " * 20 for i in range(20))
+
+    parts = split_message(text)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert " ".join(" ".join(parts).split()) == " ".join(text.split())
+
+
+def test_prefers_paragraph_boundaries():
+    first = "a" * 1500
+    second = "b" * 1000
+    assert split_message(f"{first}\n\n{second}") == [first, second]
+
+
+def test_unbroken_text_is_hard_cut():
+    parts = split_message("x" * 4500)
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert "".join(parts) == "x" * 4500
+
+
+@pytest.mark.parametrize("lines", [150, 400])
+def test_code_fences_are_balanced_in_every_part(lines):
+    code = "\n".join(f"print('line {i}')" for i in range(lines))
+    text = f"Here is the script:\n```python\n{code}\n```\nThat's all."
+
+    parts = split_message(text)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert all(part.count("```") % 2 == 0 for part in parts)
+    # Every line of code is still there, inside a fence
+    shown = "\n".join(parts)
+    assert all(f"print('line {i}')" in shown for i in range(lines))
+    assert parts[-1].endswith("That's all.")
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("discord")
+
+TOKENIZER_ENCODING = "o200k_base"  # Encoding used by gpt-4o
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_warming = False
+
+
+def load_encoding():
+    global _encoding, _encoding_loaded
+    try:
+        import tiktoken  # Optional: without it, tokens are estimated from characters
+
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating tokens from characters: {e}")
+    _encoding_loaded = True
+
+
+async def warm_up():
+    """Load the tokenizer on a worker thread; until it is ready, tokens are estimated from characters"""
+    global _warming
+    if _encoding_loaded or _warming:
+        return
+    _warming = True
+    await asyncio.get_running_loop().run_in_executor(None, load_encoding)
+
+
+def get_encoding():
+    """Load the tokenizer once; None if tiktoken or its encoding files are unavailable, or still loading"""
+    if not _encoding_loaded and not _warming:
+        load_encoding()
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " [...]") -> str:
+    """Cut text down to at most max_tokens tokens, marking where it was cut"""
+    encoding = get_encoding()
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max(max_chars - len(marker), 0)] + marker
+    ids = encoding.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    # The marker counts against the limit too
+    keep = max(max_tokens - len(encoding.encode(marker, disallowed_special=())), 0)
+    return encoding.decode(ids[:keep]) + marker
@@ -0,0 +1,392 @@
+"""
+Worker processes for the split deployment (LLM_WORKER_PROCESSES > 0).
+
+The gateway process keeps the Discord connection, user state and prompt
+construction. LLM generations and job-page fetches run in N worker processes,
+each with its own event loop, providers, scheduler and page fetcher. The two
+sides talk over a Unix socket in newline-delimited JSON frames:
+
+    gateway -> worker   {"id", "kind": "generate", "messages", "user_id", "priority", "stream", "trace"}
+                        {"id", "kind": "fetch", "url", "trace"}
+                        {"id", "kind": "stats"}
+                        {"id", "kind": "cancel"}
+    worker -> gateway   {"hello": index}
+                        {"id", "delta"}               streamed content
+                        {"id", "result"}              last frame of a job
+                        {"id", "error", "type"}       last frame of a failed job
+
+The provider rate budgets are split evenly between the workers. Run a worker by
+hand with `python workers.py <socket path> <index> <processes>`.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import logging
+import tempfile
+
+from agent import BaseAgent, LLMAgent
+from metrics import (
+    EAGER_STARTUP, METRICS_PORT, PROCESS_STARTED, Span, current_span, load_eagerly, resident_bytes, serve_metrics,
+    trace_id,
+)
+from providers import build_providers, provider_names
+from ratelimit import LLM_MAX_IN_FLIGHT, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, CircuitOpenError
+from scheduler import PRIORITY_INTERACTIVE, current_generation
+from scraper import CACHE_PATH, PageCache, PageFetcher, normalize_url
+
+logger = logging.getLogger("discord")
+
+# 0 runs everything in the gateway process
+LLM_WORKER_PROCESSES = int(os.getenv("LLM_WORKER_PROCESSES", "0"))
+# Seconds a job waits for a worker to (re)connect before failing
+WORKER_CONNECT_TIMEOUT = 30.0
+# Frames carry whole prompts and job pages
+FRAME_LIMIT = 16 * 1024 * 1024
+
+
+class WorkerError(Exception):
+    """A job failed in (or was lost with) a worker process"""
+
+
+def encode(frame: dict) -> bytes:
+    return json.dumps(frame).encode() + b"\n"
+
+
+class WorkerConnection:
+    """The gateway's end of one worker's socket, and the jobs it is running"""
+
+    def __init__(self, index: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.index = index
+        self.reader = reader
+        self.writer = writer
+        self.jobs = set()
+
+    def send(self, frame: dict):
+        if not self.writer.is_closing():
+            self.writer.write(encode(frame))
+
+
+class WorkerPool:
+    """
+    Spawns the worker processes, restarts any that exit, and routes jobs to them.
+    Generations go to the least busy worker; fetches go to the worker that owns
+    the URL, so each worker's page cache sees every request for its pages.
+    """
+
+    def __init__(self, processes: int = LLM_WORKER_PROCESSES):
+        self.processes = processes
+        self.directory = tempfile.mkdtemp(prefix="ai-agent-")
+        self.path = os.path.join(self.directory, "jobs.sock")
+        self.server = None
+        self.connections = {}  # index -> WorkerConnection
+        self.connected = asyncio.Event()
+        self.jobs = {}  # job id -> queue of reply frames
+        self.next_id = 0
+        self.supervisors = []
+        self.closing = False
+        self.restarts = 0
+        self.pids = {}  # index -> pid of the running worker process
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.path, limit=FRAME_LIMIT)
+        self.supervisors = [asyncio.create_task(self.supervise(index)) for index in range(self.processes)]
+        logger.info(f"Started {self.processes} worker processes on {self.path}")
+
+    async def supervise(self, index: int):
+        """Run worker `index`, starting it again whenever it exits"""
+        while not self.closing:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), self.path, str(index), str(self.processes))
+            self.pids[index] = process.pid
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.terminate()
+                    await process.wait()
+                raise
+            if self.closing:
+                return
+            self.restarts += 1
+            logger.warning(f"Worker {index} exited with code {code}, restarting")
+            await asyncio.sleep(1)
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = json.loads(await reader.readline() or b"{}")
+        if "hello" not in hello:
+            writer.close()
+            return
+        connection = WorkerConnection(hello["hello"], reader, writer)
+        self.connections[connection.index] = connection
+        self.connected.set()
+        logger.info(f"Worker {connection.index} connected")
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                frames = self.jobs.get(frame["id"])
+                if frames is not None:
+                    frames.put_nowait(frame)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Lost worker {connection.index}: {e}")
+        finally:
+            if self.connections.get(connection.index) is connection:
+                del self.connections[connection.index]
+            if not self.connections:
+                self.connected.clear()
+            for job_id in connection.jobs:
+                frames = self.jobs.get(job_id)
+                if frames is not None:
+                    frames.put_nowait({"id": job_id, "error": f"worker {connection.index} exited", "type": "WorkerError"})
+            writer.close()
+
+    async def pick(self, key: str = None) -> WorkerConnection:
+        if not self.connections:
+            try:
+                await asyncio.wait_for(self.connected.wait(), WORKER_CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise WorkerError("no worker process is available") from None
+        if key is not None:
+            owner = self.connections.get(zlib.crc32(key.encode()) % self.processes)
+            if owner is not None:
+                return owner
+        return min(self.connections.values(), key=lambda connection: len(connection.jobs))
+
+    def new_job(self) -> int:
+        """Register a job id, so the job can be failed or cancelled before it is sent"""
+        self.next_id += 1
+        self.jobs[self.next_id] = asyncio.Queue()
+        return self.next_id
+
+    async def run_job(self, kind: str, key: str = None, connection: WorkerConnection = None,
+                      job_id: int = None, **payload):
+        """Send a job and yield its reply frames; raises on an error frame, cancels the job if abandoned"""
+        if job_id is None:
+            job_id = self.new_job()
+        frames = self.jobs[job_id]
+        finished = False
+        try:
+            if connection is None:
+                connection = await self.pick(key)
+            connection.jobs.add(job_id)
+            connection.send({"id": job_id, "kind": kind, "trace": trace_id(), **payload})
+            await connection.writer.drain()
+            while True:
+                frame = await frames.get()
+                if "cancelled" in frame:
+                    raise asyncio.CancelledError()
+                if "error" in frame:
+                    finished = True
+                    if frame["type"] == "CircuitOpenError":
+                        raise CircuitOpenError(frame["error"])
+                    raise WorkerError(f"{frame['type']}: {frame['error']}")
+                finished = "result" in frame
+                yield frame
+                if finished:
+                    return
+        finally:
+            self.jobs.pop(job_id, None)
+            if connection is not None:
+                connection.jobs.discard(job_id)
+                if not finished:
+                    connection.send({"id": job_id, "kind": "cancel"})
+
+    async def result(self, kind: str, key: str = None, connection: WorkerConnection = None, **payload):
+        async for frame in self.run_job(kind, key, connection, **payload):
+            if "result" in frame:
+                return frame["result"]
+
+    def cancel_jobs(self, job_ids) -> int:
+        """End jobs as cancelled, as if their futures had been cancelled in process"""
+        cancelled = 0
+        for job_id in job_ids:
+            frames = self.jobs.get(job_id)
+            if frames is not None:
+                frames.put_nowait({"id": job_id, "cancelled": True})
+                cancelled += 1
+        return cancelled
+
+    async def stats(self) -> list:
+        """Each connected worker's LLM and page-fetch stats, in worker order"""
+        connections = [self.connections[index] for index in sorted(self.connections)]
+        return list(await asyncio.gather(*(self.result("stats", connection=c) for c in connections)))
+
+    async def close(self):
+        self.closing = True
+        for connection in list(self.connections.values()):
+            connection.writer.close()  # Workers exit when the gateway goes away
+        if self.supervisors:
+            _, running = await asyncio.wait(self.supervisors, timeout=5)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*self.supervisors, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+        try:
+            os.unlink(self.path)
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+class RemoteAgent(BaseAgent):
+    """
+    Agent for the gateway process: the response cache stays here, every cache miss
+    runs on a worker. Deltas of a streamed request are forwarded as they arrive.
+    """
+
+    def __init__(self, pool: WorkerPool):
+        super().__init__("workers:" + ",".join(provider_names()))
+        self.pool = pool
+        self.pending = {}  # job id -> (user_id, generation), until the job's first delta or result
+
+    async def generate(self, messages, user_id, priority: int, stream: bool):
+        job_id = self.pool.new_job()
+        self.pending[job_id] = (user_id, current_generation.get())
+        frames = self.pool.run_job("generate", job_id=job_id, messages=messages, user_id=user_id,
+                                   priority=priority, stream=stream)
+        try:
+            async for frame in frames:
+                self.pending.pop(job_id, None)
+                yield frame
+        finally:
+            self.pending.pop(job_id, None)
+            await frames.aclose()
+            self.pool.jobs.pop(job_id, None)  # In case the job never started
+
+    def cancel_pending(self, user_id, generation) -> int:
+        """Cancel a user's jobs of a superseded generation that have not produced output yet"""
+        return self.pool.cancel_jobs([job_id for job_id, owner in self.pending.items() if owner == (user_id, generation)])
+
+    async def has_headroom(self) -> bool:
+        """The rate-limit budgets live in the workers: true if any of them has room to spare"""
+        connections = list(self.pool.connections.values())
+        try:
+            answers = await asyncio.gather(*(self.pool.result("headroom", connection=c) for c in connections))
+        except WorkerError:
+            return False
+        return any(answers)
+
+    async def queue_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        async for frame in self.generate(messages, user_id, priority, stream=False):
+            if "result" in frame:
+                return frame["result"]
+
+    async def queue_stream_request(self, messages, user_id=None, priority: int = PRIORITY_INTERACTIVE):
+        async for frame in self.generate(messages, user_id, priority, stream=True):
+            if "delta" in frame:
+                yield frame["delta"]
+
+
+class RemotePageFetcher:
+    """PageFetcher's interface for the gateway; pages are fetched and parsed on the URL's worker"""
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+
+    async def fetch_website_info(self, url: str) -> str:
+        return await self.pool.result("fetch", key=normalize_url(url), url=url)
+
+    async def close(self):
+        pass
+
+
+class Worker:
+    """The worker-process side: serves jobs from the gateway with a local agent and fetcher"""
+
+    def __init__(self, index: int, processes: int):
+        self.index = index
+        share = 1 / processes
+        providers = build_providers(
+            max_in_flight=max(1, LLM_MAX_IN_FLIGHT // processes),
+            requests_per_minute=max(1, int(LLM_REQUESTS_PER_MINUTE * share)),
+            tokens_per_minute=max(1, int(LLM_TOKENS_PER_MINUTE * share)),
+        )
+        for provider in providers:
+            provider.rate_limiter.share = share
+        self.agent = LLMAgent(providers)
+        if EAGER_STARTUP:
+            load_eagerly(providers)
+        # Workers own disjoint URLs, so each keeps its own page cache file
+        self.page_fetcher = PageFetcher(cache=PageCache(path=f"{CACHE_PATH}.{index}" if CACHE_PATH else None))
+        self.tasks = {}  # job id -> task
+        self.writer = None
+
+    def send(self, frame: dict):
+        if not self.writer.is_closing():
+            self.writer.write(encode(frame))
+
+    async def run(self, path: str):
+        reader, self.writer = await asyncio.open_unix_connection(path, limit=FRAME_LIMIT)
+        self.send({"hello": self.index})
+        logger.info(
+            f"Worker {self.index} ready {time.time() - PROCESS_STARTED:.1f}s after start, "
+            f"{resident_bytes() / 2**20:.0f} MiB resident"
+        )
+        metrics_server = await serve_metrics(port=METRICS_PORT + 1 + self.index) if METRICS_PORT else None
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                if frame["kind"] == "cancel":
+                    task = self.tasks.get(frame["id"])
+                    if task is not None:
+                        task.cancel()
+                else:
+                    self.tasks[frame["id"]] = asyncio.create_task(self.serve(frame))
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await self.page_fetcher.close()
+
+    async def serve(self, frame: dict):
+        job_id = frame["id"]
+        # Continue the gateway's trace, so its log lines and ours share an id
+        job_span = Span(f"worker_{frame['kind']}", user=frame.get("user_id"))
+        if frame.get("trace", "-") != "-":
+            job_span.trace_id = frame["trace"]
+        current_span.set(job_span)
+        try:
+            result = await self.handle(frame)
+            self.send({"id": job_id, "result": result})
+        except asyncio.CancelledError:
+            pass  # The gateway stopped waiting
+        except Exception as e:
+            logger.warning(f"[trace {job_span.trace_id}] Job {frame['kind']} failed: {e!r}")
+            self.send({"id": job_id, "error": str(e), "type": type(e).__name__})
+        finally:
+            job_span.end()
+            del self.tasks[job_id]
+
+    async def handle(self, frame: dict):
+        kind = frame["kind"]
+        if kind == "generate":
+            if not frame["stream"]:
+                return await self.agent.queue_request(frame["messages"], frame["user_id"], frame["priority"])
+            async for delta in self.agent.queue_stream_request(frame["messages"], frame["user_id"], frame["priority"]):
+                self.send({"id": frame["id"], "delta": delta})
+            return None
+        if kind == "fetch":
+            return await self.page_fetcher.fetch_website_info(frame["url"])
+        if kind == "headroom":
+            return await self.agent.has_headroom()
+        if kind == "stats":
+            return {"worker": self.index, "llm": self.agent.stats(), "pages": self.page_fetcher.stats()}
+        raise WorkerError(f"unknown job kind {kind}")
+
+
+def main(argv: list):
+    path, index, processes = argv[0], int(argv[1]), int(argv[2])
+    logging.basicConfig(format=f"%(asctime)s worker {index} %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+    try:
+        asyncio.run(Worker(index, processes).run(path))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])